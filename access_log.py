@@ -0,0 +1,250 @@
+"""Structured access log: one JSON line per request, written off the event loop.
+
+AccessLogMiddleware turns each request into a tuple in an in-memory ring
+buffer, and that is all a request pays. The tuple holds the time, method,
+path with query, route template, status, latency, response bytes,
+User-Agent, content type and encoding served.
+
+Every `flush_interval` seconds a background task swaps the buffer out, and
+a worker thread serializes the batch and appends it to access.<pid>.jsonl.
+There is one file per worker, so workers never interleave lines or rotate
+each other's files. A file that reaches `max_bytes` is renamed with a
+timestamp and, with `compress`, gzipped. Only the newest `backups` rotated
+files are kept. If the disk falls behind by more than the buffer holds,
+the oldest records are dropped and counted rather than kept in memory.
+
+    python bench.py --replay var/log/access.*.jsonl*
+
+feeds logged requests back through the app, in order, so a benchmark sees
+the same traffic mix as production.
+"""
+import asyncio
+import gzip
+import json
+import logging
+import os
+import re
+import shutil
+import time
+from collections import deque
+from datetime import datetime, timezone
+from pathlib import Path
+
+from inprocess import INTERNAL
+from json_responses import dumps
+from metrics import UNMATCHED
+
+
+logger = logging.getLogger(__name__)
+
+MAX_USER_AGENT = 512
+
+_ROTATED = re.compile(r"^access\.\d+\.(\d{8}T\d{12})\.jsonl(?:\.gz)?$")
+
+
+def _row(entry: tuple) -> bytes:
+    started, method, path, query, route, status, duration, size, user_agent, content_type, encoding = entry
+    if query:
+        path = f"{path}?{query.decode('latin-1')}"
+    return dumps({
+        "time": round(started, 3),
+        "method": method,
+        "path": path,
+        "route": route,
+        "status": status,
+        "duration_ms": round(duration * 1000, 3),
+        "bytes": size,
+        "user_agent": user_agent[:MAX_USER_AGENT].decode("latin-1") if user_agent is not None else None,
+        "content_type": content_type.decode("latin-1") if content_type is not None else None,
+        "encoding": encoding.decode("latin-1") if encoding is not None else None,
+    })
+
+
+def read_log(paths):
+    """The records of one or more log files, plain or gzipped, in file order; broken lines are skipped."""
+    for path in paths:
+        path = Path(path)
+        opener = gzip.open if path.suffix == ".gz" else open
+        with opener(path, "rt", encoding="utf-8") as lines:
+            for line in lines:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+class AccessLog:
+    def __init__(
+        self,
+        directory: Path,
+        capacity: int = 65536,
+        flush_interval: float = 1.0,
+        max_bytes: int = 64 * 1024 * 1024,
+        backups: int = 20,
+        compress: bool = True,
+    ):
+        self.directory = Path(directory)
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.compress = compress
+        self.recorded = 0
+        self.dropped = 0
+        self.written = 0
+        self.rotations = 0
+        self.path = None
+        self._buffer = deque(maxlen=capacity)
+        self._file = None
+        self._task = None
+        self._stopping = asyncio.Event()
+
+    def record(self, entry: tuple):
+        if len(self._buffer) == self.capacity:
+            self.dropped += 1
+        self._buffer.append(entry)
+        self.recorded += 1
+
+    async def start(self):
+        await asyncio.to_thread(self._open)
+        self._stopping.clear()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._stopping.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+        # Requests that finished while the last batch was being written.
+        await self.flush()
+        await asyncio.to_thread(self._close)
+
+    async def flush(self):
+        if not self._buffer or self._file is None:
+            return
+        batch, self._buffer = self._buffer, deque(maxlen=self.capacity)
+        try:
+            await asyncio.to_thread(self._write, batch)
+        except Exception:
+            logger.exception("Failed to write %d access log records", len(batch))
+            return
+        self.written += len(batch)
+
+    async def _run(self):
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    def _open(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # Resolved here, not at import, so every worker process gets its own file.
+        self.path = self.directory / f"access.{os.getpid()}.jsonl"
+        self._file = open(self.path, "ab")
+
+    def _close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _write(self, batch: deque):
+        self._file.write(b"".join([_row(entry) + b"\n" for entry in batch]))
+        self._file.flush()
+        if self._file.tell() >= self.max_bytes:
+            self._rotate()
+
+    def _rotate(self):
+        self._file.close()
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+        rotated = self.path.with_name(f"{self.path.stem}.{stamp}.jsonl")
+        os.replace(self.path, rotated)
+        self._file = open(self.path, "ab")
+        if self.compress:
+            target = rotated.with_name(rotated.name + ".gz")
+            temporary = target.with_suffix(".tmp")
+            with open(rotated, "rb") as source, gzip.open(temporary, "wb") as compressed:
+                shutil.copyfileobj(source, compressed)
+            os.replace(temporary, target)
+            rotated.unlink()
+        self.rotations += 1
+        self._prune()
+
+    def _prune(self):
+        # Across all workers' files, so the total stays bounded however many workers have come and gone.
+        rotated = sorted(
+            (match.group(1), path)
+            for path in self.directory.iterdir()
+            if (match := _ROTATED.match(path.name)) is not None
+        )
+        for _, path in rotated[:max(0, len(rotated) - self.backups)]:
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> dict:
+        return {
+            "recorded": self.recorded,
+            "dropped": self.dropped,
+            "written": self.written,
+            "rotations": self.rotations,
+            "buffered": len(self._buffer),
+        }
+
+
+class AccessLogMiddleware:
+    def __init__(self, app, log: AccessLog):
+        self.app = app
+        self.log = log
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get(INTERNAL):
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        size = 0
+        content_type = None
+        encoding = None
+
+        async def send_wrapper(message):
+            nonlocal status, size, content_type, encoding
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                for name, value in message.get("headers", ()):
+                    if name == b"content-type":
+                        content_type = value
+                    elif name == b"content-encoding":
+                        encoding = value
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        started = time.time()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = time.perf_counter() - start
+            route = scope.get("route")
+            user_agent = None
+            for name, value in scope["headers"]:
+                if name == b"user-agent":
+                    user_agent = value
+                    break
+            # Raw values only; decoding and serializing happen on the writer thread.
+            self.log.record((
+                started,
+                scope["method"],
+                scope["path"],
+                scope.get("query_string"),
+                route.path if route is not None else UNMATCHED,
+                status,
+                duration,
+                size,
+                user_agent,
+                content_type,
+                encoding,
+            ))
@@ -0,0 +1,79 @@
+import hashlib
+import mimetypes
+import os
+import re
+from email.utils import formatdate
+from pathlib import Path
+
+from precompress import compress_variants, negotiate
+from render_cache import CachedResponse, Variant, is_not_modified
+
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+_CSS_COMMENT = re.compile(r"/\*.*?\*/", re.S)
+_CSS_SPACE = re.compile(r"\s+")
+_CSS_PUNCT = re.compile(r"\s*([{};,>])\s*")
+
+
+def minify_css(css: str) -> str:
+    css = _CSS_COMMENT.sub("", css)
+    css = _CSS_SPACE.sub(" ", css)
+    css = _CSS_PUNCT.sub(r"\1", css)
+    css = css.replace(";}", "}").replace(": ", ":")
+    return css.strip()
+
+
+class StaticAsset:
+    """A file served under a content-hashed name with precompressed variants."""
+
+    def __init__(self, path: Path, url_prefix: str = "/assets", minify: bool = False, transform=None):
+        data = path.read_bytes()
+        if transform is not None:
+            data = transform(data.decode("utf-8")).encode("utf-8")
+        if minify and path.suffix == ".css":
+            data = minify_css(data.decode("utf-8")).encode("utf-8")
+        self.path = path
+        self.data = data
+        digest = hashlib.sha256(data).hexdigest()[:12]
+        self.name = f"{path.stem}.{digest}{path.suffix}"
+        self.url = f"{url_prefix}/{self.name}"
+        content_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+        if content_type.startswith("text/"):
+            content_type += "; charset=utf-8"
+        self.modified = int(path.stat().st_mtime)
+        last_modified = formatdate(self.modified, usegmt=True)
+        compressed = compress_variants(data)
+        self.variants = {None: Variant(data, f'"{digest}"', None, last_modified, IMMUTABLE, content_type)}
+        for coding, body in compressed.items():
+            self.variants[coding] = Variant(body, f'"{digest}-{coding}"', coding, last_modified, IMMUTABLE, content_type)
+        self.codings = tuple(compressed)
+        self.etags = frozenset(variant.etag for variant in self.variants.values())
+
+    def response(self, request) -> CachedResponse:
+        headers = request.headers
+        variant = self.variants[negotiate(headers.get("accept-encoding"), self.codings)]
+        if is_not_modified(headers, self.etags, self.modified):
+            return CachedResponse(variant, 304)
+        return CachedResponse(variant)
+
+
+class AssetRegistry:
+    def __init__(self, url_prefix: str = "/assets", minify: bool | None = None):
+        if minify is None:
+            minify = os.environ.get("ASSETS_MINIFY", "1") != "0"
+        self.url_prefix = url_prefix
+        self.minify = minify
+        self._by_name = {}
+
+    def add(self, path: Path, transform=None) -> StaticAsset:
+        """Register a file; `transform` (str -> str) rewrites its text before it is hashed."""
+        asset = StaticAsset(path, self.url_prefix, self.minify, transform)
+        self._by_name[asset.name] = asset
+        return asset
+
+    def get(self, name: str) -> StaticAsset | None:
+        return self._by_name.get(name)
+
+    def __iter__(self):
+        return iter(self._by_name.values())
@@ -0,0 +1,323 @@
+"""Throughput and latency benchmarks for every route of the app.
+
+    python bench.py                              # in-process, straight into the ASGI app
+    python bench.py --mode asgi                  # through httpx's ASGI transport
+    python bench.py --mode socket --workers 2    # against a uvicorn started for the run
+    python bench.py --mode socket --url http://127.0.0.1:8000
+    python bench.py -o after.json --compare before.json
+    python bench.py --replay var/log/access.*.jsonl*   # the request mix of real access logs
+
+Results are written as JSON so two commits can be compared with --compare.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from inprocess import request
+
+
+BASE_DIR = Path(__file__).resolve().parent
+
+BROWSER_UA = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0 Safari/537.36"
+
+# name -> (path, extra request headers)
+SCENARIOS = {
+    "home": ("/", {}),
+    "home_gzip": ("/", {"accept-encoding": "gzip, deflate, br"}),
+    "news": ("/news", {}),
+    "management": ("/management", {}),
+    "about": ("/about", {}),
+    "contacts": ("/contacts", {}),
+    "branches": ("/branches", {}),
+    "branch_hit": ("/branches/Paris", {}),
+    "branch_miss": ("/branches/Atlantis", {}),
+    "news_article": ("/news/x-tech-launch", {}),
+    "news_feed": ("/news/feed.atom", {}),
+    "api_search": ("/api/search?q=%D1%84%D0%B8%D0%BB%D0%B8%D0%B0%D0%BB", {}),
+    "catch_all": ("/about/some/old/link", {}),
+    "not_found": ("/wp-login.php", {}),
+    "stylesheet": (None, {}),
+    "api_random": ("/api/random", {}),
+    "api_random_batch": ("/api/random?count=1000", {}),
+    "api_random_msgpack": ("/api/random?count=1000", {"accept": "application/msgpack"}),
+    "api_user_agent": ("/api/user-agent", {}),
+}
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, round(fraction * (len(sorted_values) - 1)))
+    return sorted_values[index]
+
+
+def summarize(latencies: list, sizes: list, statuses: dict, elapsed: float) -> dict:
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "req_per_s": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "bytes_per_response": round(sum(sizes) / len(sizes)) if sizes else 0,
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+    }
+
+
+async def run_scenario(send, path: str, headers: dict, requests: int, concurrency: int) -> dict:
+    latencies, sizes, statuses = [], [], {}
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            status, size = await send(path, headers)
+            latencies.append(time.perf_counter() - start)
+            sizes.append(size)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, sizes, statuses, time.perf_counter() - started)
+
+
+async def run_replay(send, entries: list, requests: int, concurrency: int) -> dict:
+    """Send `requests` logged requests in log order, starting over at the end; results overall and per route."""
+    overall = ([], [], {})
+    by_route = {}
+    sent = 0
+
+    async def worker():
+        nonlocal sent
+        while sent < requests:
+            route, method, path, headers = entries[sent % len(entries)]
+            sent += 1
+            start = time.perf_counter()
+            status, size = await send(path, headers, method)
+            latency = time.perf_counter() - start
+            for latencies, sizes, statuses in (overall, by_route.setdefault(route, ([], [], {}))):
+                latencies.append(latency)
+                sizes.append(size)
+                statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    results = {"replay": summarize(*overall, elapsed)}
+    # A route's req/s is its share of the mixed run, busiest route first.
+    for route, measured in sorted(by_route.items(), key=lambda item: -len(item[1][0])):
+        results[f"replay {route}"] = summarize(*measured, elapsed)
+    return results
+
+
+def replay_entries(paths) -> tuple:
+    """(route, method, path, headers) for each GET and HEAD of the access logs, and how many others were skipped."""
+    from access_log import read_log
+
+    entries = []
+    skipped = 0
+    for record in read_log(paths):
+        if record.get("method") not in ("GET", "HEAD"):
+            # Bodies are not logged, so there is nothing to send again.
+            skipped += 1
+            continue
+        headers = {}
+        if record.get("user_agent"):
+            headers["user-agent"] = record["user_agent"]
+        if record.get("encoding"):
+            headers["accept-encoding"] = record["encoding"]
+        if record.get("content_type"):
+            headers["accept"] = record["content_type"].split(";")[0]
+        entries.append((record.get("route"), record["method"], record["path"], headers))
+    return entries, skipped
+
+
+def inprocess_sender(app):
+    async def send(path, headers, method="GET"):
+        status, _, body = await request(
+            app, path, method=method, headers=list({"user-agent": BROWSER_UA, **headers}.items())
+        )
+        # Servers drop a HEAD response's body on the wire; called directly, the app still produces one.
+        return status, 0 if method == "HEAD" else len(body)
+
+    return send
+
+
+def httpx_sender(client):
+    async def send(path, headers, method="GET"):
+        response = await client.request(method, path, headers=headers)
+        # Wire size, before httpx transparently decompresses the body; a HEAD response has none.
+        size = 0 if method == "HEAD" else int(response.headers.get("content-length", len(response.content)))
+        return response.status_code, size
+
+    return send
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(workers: int, extra_args: list) -> tuple:
+    port = _free_port()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "server", "--port", str(port), "--workers", str(workers), "--no-access-log",
+         "--log-level", "warning", *extra_args],
+        cwd=BASE_DIR,
+    )
+    deadline = time.monotonic() + 20
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return process, f"http://127.0.0.1:{port}"
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("server did not start")
+
+
+async def run(args) -> dict:
+    # Every benchmark request comes from one client; keep the 404 limiter and
+    # the rate limits in the path but never tripping, so each scenario measures
+    # the page itself.
+    os.environ.setdefault("NOT_FOUND_BURST", "1e12")
+    os.environ.setdefault("RATE_LIMIT_SCALE", "1e12")
+    import main
+
+    if args.replay:
+        entries, skipped = replay_entries(args.replay)
+        if not entries:
+            raise SystemExit("No GET requests in the replayed logs")
+        print(f"Replaying {len(entries)} logged requests ({skipped} others skipped)")
+
+    scenarios = dict(SCENARIOS)
+    scenarios["stylesheet"] = (main.SITE_CSS.url, {})
+    selected = args.only or list(scenarios)
+
+    process = None
+    client = None
+    if args.mode == "inprocess":
+        send = inprocess_sender(main.app)
+    else:
+        import httpx
+
+        if args.mode == "asgi":
+            transport = httpx.ASGITransport(app=main.app)
+            base_url = "http://bench"
+        else:
+            base_url = args.url
+            if base_url is None:
+                process, base_url = start_server(args.workers, args.server_arg)
+            transport = httpx.AsyncHTTPTransport(
+                limits=httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+            )
+        client = httpx.AsyncClient(transport=transport, base_url=base_url, headers={"user-agent": BROWSER_UA})
+        send = httpx_sender(client)
+
+    results = {}
+    # In-process runs start the app the way a server would: warmed up and with the search index built.
+    lifespan = main.app.router.lifespan_context(main.app) if process is None and args.url is None else None
+    try:
+        if lifespan is not None:
+            await lifespan.__aenter__()
+        if args.replay:
+            await run_replay(send, entries, args.warmup, args.concurrency)
+            results = await run_replay(send, entries, args.requests, args.concurrency)
+            width = max(map(len, results))
+            for name, result in results.items():
+                print(_format_row(name, result, width))
+        else:
+            for name in selected:
+                path, headers = scenarios[name]
+                await run_scenario(send, path, headers, args.warmup, args.concurrency)
+                results[name] = await run_scenario(send, path, headers, args.requests, args.concurrency)
+                print(_format_row(name, results[name]))
+    finally:
+        if client is not None:
+            await client.aclose()
+        if lifespan is not None:
+            await lifespan.__aexit__(None, None, None)
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "mode": args.mode,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "workers": args.workers if args.mode == "socket" else 1,
+            "replay": [str(path) for path in args.replay] if args.replay else None,
+        },
+        "results": results,
+    }
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _format_row(name: str, result: dict, width: int = 16) -> str:
+    return (
+        f"{name:<{width}} {result['req_per_s']:>10.1f} req/s  p50 {result['p50_ms']:>8.3f} ms  "
+        f"p95 {result['p95_ms']:>8.3f} ms  p99 {result['p99_ms']:>8.3f} ms  {result['bytes_per_response']:>7} B"
+    )
+
+
+def compare(current: dict, baseline: dict):
+    print(f"\nagainst {baseline['meta'].get('commit')} ({baseline['meta'].get('mode')}):")
+    for name, result in current["results"].items():
+        before = baseline["results"].get(name)
+        if before is None or not before["req_per_s"]:
+            continue
+        change = (result["req_per_s"] - before["req_per_s"]) / before["req_per_s"] * 100
+        print(
+            f"{name:<16} {before['req_per_s']:>10.1f} -> {result['req_per_s']:>10.1f} req/s ({change:+.1f}%)  "
+            f"p99 {before['p99_ms']:.3f} -> {result['p99_ms']:.3f} ms  "
+            f"{before['bytes_per_response']} -> {result['bytes_per_response']} B"
+        )
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark every route of the app.")
+    parser.add_argument("--mode", choices=["inprocess", "asgi", "socket"], default="inprocess")
+    parser.add_argument("--requests", "-n", type=int, default=2000, help="measured requests per scenario")
+    parser.add_argument("--warmup", type=int, default=200, help="unmeasured requests per scenario")
+    parser.add_argument("--concurrency", "-c", type=int, default=1)
+    parser.add_argument("--only", action="append", choices=list(SCENARIOS), help="run only these scenarios")
+    parser.add_argument("--replay", nargs="+", type=Path, help="replay these access logs instead of the scenarios")
+    parser.add_argument("--url", help="socket mode: benchmark an already running server")
+    parser.add_argument("--workers", type=int, default=1, help="socket mode: uvicorn workers to start")
+    parser.add_argument("--server-arg", action="append", default=[], help="socket mode: extra python -m server flag")
+    parser.add_argument("--output", "-o", type=Path, default=BASE_DIR / "var" / "bench_results.json")
+    parser.add_argument("--compare", type=Path, help="previous results file to compare against")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run(args))
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"\nWrote {args.output}")
+    if args.compare is not None:
+        compare(report, json.loads(args.compare.read_text(encoding="utf-8")))
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,59 @@
+import json
+import re
+from pathlib import Path
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+
+_NON_SLUG = re.compile(r"[^\w]+")
+
+
+def slugify(value: str) -> str:
+    return _NON_SLUG.sub("-", value.casefold()).strip("-")
+
+
+class BranchRegistry:
+    """All branches, loaded once, with O(1) lookups by city, name or slug.
+
+    `branches` keeps the order of the data file, which is the order the
+    list page and the quick links show them in.
+    """
+
+    def __init__(self, branches: list):
+        self.branches = branches
+        self._by_city = {}
+        self._index = {}
+        for branch in branches:
+            city = branch["city"]
+            if city in self._by_city:
+                raise ValueError(f"Duplicate branch: {city}")
+            self._by_city[city] = branch
+            for alias in (city, branch["name"]):
+                self._index.setdefault(alias.casefold(), branch)
+                self._index.setdefault(slugify(alias), branch)
+
+    @classmethod
+    def load(cls, path: Path) -> "BranchRegistry":
+        text = path.read_text(encoding="utf-8")
+        if path.suffix in (".yaml", ".yml"):
+            if yaml is None:
+                raise RuntimeError(f"PyYAML is required to load {path}")
+            data = yaml.safe_load(text)
+        else:
+            data = json.loads(text)
+        return cls(data)
+
+    def get(self, city: str) -> dict | None:
+        branch = self._by_city.get(city)
+        if branch is None:
+            branch = self._index.get(city.casefold()) or self._index.get(slugify(city))
+        return branch
+
+    def __iter__(self):
+        return iter(self.branches)
+
+    def __len__(self):
+        return len(self.branches)
@@ -0,0 +1,259 @@
+"""Cache tiers for rendered pages.
+
+LRUCache is the per-worker tier, bounded by entry count, total bytes and an
+optional TTL. RedisCache is the optional shared tier: a minimal RESP client
+(GET/SET/DEL over one connection per worker), so that any Redis-compatible
+server (Redis, KeyDB, Valkey) lets several workers render each page once
+between them. It only speaks to the server when the local tier misses, and
+while the server is unreachable every call degrades to a miss.
+
+    python cache_backends.py serve --port 6379
+
+runs a small stand-in that understands just the commands RedisCache sends,
+for local multi-worker runs and tests without a real server.
+"""
+import argparse
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from urllib.parse import unquote, urlsplit
+
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache:
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 64 * 1024 * 1024, ttl: float | None = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.bytes = 0
+        self.evictions = 0
+        # key -> (value, size, monotonic expiry or None)
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires = entry[2]
+        if expires is not None and time.monotonic() >= expires:
+            self.pop(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def set(self, key, value, size: int = 0, ttl: float | None = None):
+        self.pop(key)
+        if size > self.max_bytes:
+            return
+        ttl = self.ttl if ttl is None else ttl
+        self._entries[key] = (value, size, time.monotonic() + ttl if ttl else None)
+        self.bytes += size
+        while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+            _, (_, evicted_size, _) = self._entries.popitem(last=False)
+            self.bytes -= evicted_size
+            self.evictions += 1
+
+    def pop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+        self.bytes -= entry[1]
+        return entry[0]
+
+    def clear(self):
+        self._entries.clear()
+        self.bytes = 0
+
+    def values(self):
+        return [entry[0] for entry in self._entries.values()]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class RespError(Exception):
+    pass
+
+
+def encode_command(args) -> bytes:
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if not isinstance(arg, bytes):
+            arg = str(arg).encode("utf-8")
+        parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(parts)
+
+
+async def read_reply(reader: asyncio.StreamReader):
+    line = await reader.readuntil(b"\r\n")
+    kind, rest = line[:1], line[1:-2]
+    if kind == b"+":
+        return rest.decode("utf-8")
+    if kind == b"-":
+        raise RespError(rest.decode("utf-8", "replace"))
+    if kind == b":":
+        return int(rest)
+    if kind == b"$":
+        length = int(rest)
+        if length < 0:
+            return None
+        return (await reader.readexactly(length + 2))[:-2]
+    if kind == b"*":
+        length = int(rest)
+        if length < 0:
+            return None
+        return [await read_reply(reader) for _ in range(length)]
+    raise RespError(f"Unexpected reply: {line[:40]!r}")
+
+
+class RedisCache:
+    def __init__(self, url: str, prefix: str = "pages:", timeout: float = 0.5, retry_after: float = 5.0):
+        parts = urlsplit(url)
+        self.unix_path = parts.path if parts.scheme == "unix" else None
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or 6379
+        self.password = unquote(parts.password) if parts.password else None
+        self.db = int(parts.path.lstrip("/") or 0) if parts.scheme != "unix" else 0
+        self.prefix = prefix
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.errors = 0
+        self._reader = None
+        self._writer = None
+        self._loop = None
+        self._lock = asyncio.Lock()
+        self._down_until = 0.0
+
+    async def _connect(self):
+        if self.unix_path is not None:
+            self._reader, self._writer = await asyncio.open_unix_connection(self.unix_path)
+        else:
+            self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        self._loop = asyncio.get_running_loop()
+        if self.password is not None:
+            await self._call("AUTH", self.password)
+        if self.db:
+            await self._call("SELECT", self.db)
+
+    async def _call(self, *args):
+        self._writer.write(encode_command(args))
+        return await read_reply(self._reader)
+
+    def _disconnect(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = self._loop = None
+
+    async def execute(self, *args):
+        """Run one command; None when the server cannot be reached (and for nil replies)."""
+        if time.monotonic() < self._down_until:
+            return None
+        async with self._lock:
+            try:
+                if self._writer is None or self._loop is not asyncio.get_running_loop():
+                    self._disconnect()
+                    await asyncio.wait_for(self._connect(), self.timeout)
+                return await asyncio.wait_for(self._call(*args), self.timeout)
+            except (OSError, EOFError, asyncio.IncompleteReadError, asyncio.TimeoutError, RespError) as exc:
+                self.errors += 1
+                # A half-read reply would poison the next one, so start over on a new connection.
+                self._disconnect()
+                self._down_until = time.monotonic() + self.retry_after
+                logger.warning("Shared cache unavailable for %ss: %r", self.retry_after, exc)
+                return None
+
+    async def get(self, key: str) -> bytes | None:
+        return await self.execute("GET", self.prefix + key)
+
+    async def set(self, key: str, value: bytes, ttl: float | None = None):
+        if ttl:
+            await self.execute("SET", self.prefix + key, value, "PX", max(1, int(ttl * 1000)))
+        else:
+            await self.execute("SET", self.prefix + key, value)
+
+    async def acquire(self, key: str, ttl: float) -> bool:
+        """Take the render lock for `key`; also True when the server is down, so the caller renders itself."""
+        if time.monotonic() < self._down_until:
+            return True
+        reply = await self.execute("SET", self.prefix + "lock:" + key, "1", "NX", "PX", max(1, int(ttl * 1000)))
+        return reply is not None or time.monotonic() < self._down_until
+
+    async def release(self, key: str):
+        await self.execute("DEL", self.prefix + "lock:" + key)
+
+    async def close(self):
+        async with self._lock:
+            self._disconnect()
+
+
+class StandInServer:
+    """Just enough of a Redis server for RedisCache: PING, AUTH, SELECT, GET, SET (NX, EX, PX), DEL, FLUSHDB."""
+
+    def __init__(self):
+        self.data = {}
+
+    def _get(self, key):
+        entry = self.data.get(key)
+        if entry is not None and entry[1] is not None and time.monotonic() >= entry[1]:
+            del self.data[key]
+            return None
+        return entry
+
+    def command(self, args: list) -> bytes:
+        name = args[0].upper()
+        if name in (b"PING", b"AUTH", b"SELECT", b"FLUSHDB"):
+            if name == b"FLUSHDB":
+                self.data.clear()
+            return b"+PONG\r\n" if name == b"PING" else b"+OK\r\n"
+        if name == b"GET":
+            entry = self._get(args[1])
+            return b"$-1\r\n" if entry is None else b"$%d\r\n%s\r\n" % (len(entry[0]), entry[0])
+        if name == b"SET":
+            expires = None
+            options = [arg.upper() for arg in args[3:]]
+            if b"NX" in options and self._get(args[1]) is not None:
+                return b"$-1\r\n"
+            for unit, scale in ((b"PX", 1000), (b"EX", 1)):
+                if unit in options:
+                    expires = time.monotonic() + int(args[3 + options.index(unit) + 1]) / scale
+            self.data[args[1]] = (args[2], expires)
+            return b"+OK\r\n"
+        if name == b"DEL":
+            return b":%d\r\n" % sum(self.data.pop(key, None) is not None for key in args[1:])
+        return b"-ERR unknown command '%s'\r\n" % name
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                args = await read_reply(reader)
+                writer.write(self.command(args))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str, port: int):
+        server = await asyncio.start_server(self.handle, host, port)
+        async with server:
+            await server.serve_forever()
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Run a stand-in for the shared page cache server.")
+    parser.add_argument("command", choices=["serve"])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    args = parser.parse_args(argv)
+    print(f"Serving on {args.host}:{args.port}")
+    try:
+        asyncio.run(StandInServer().serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,110 @@
+"""Render every static route of the app to a directory nginx or a CDN can serve as is.
+
+    python export.py build/site
+
+Each page is written as <path>/index.html next to .gz/.br/.zst copies
+(for nginx gzip_static/brotli_static), the 404 page as 404.html, and a
+manifest.json describing every file. /api/* and the catch-all routes
+stay with the FastAPI process.
+"""
+import argparse
+import asyncio
+import json
+import re
+import shutil
+from pathlib import Path
+
+from fastapi.routing import APIRoute
+
+import main
+from inprocess import request
+from precompress import compress_variants
+
+
+DYNAMIC_PREFIXES = ("/api/", "/metrics", "/search")
+NOT_FOUND_PATH = "/__export_not_found__"
+EXTENSIONS = {"gzip": ".gz", "br": ".br", "zstd": ".zst"}
+
+_PARAM = re.compile(r"{(\w+)(:\w+)?}")
+
+# Values to expand parametrised routes with; routes missing here are not exported.
+PARAMS = {
+    "/branches/{city}": {"city": lambda: [branch["city"] for branch in main.branches]},
+    "/assets/{name}": {"name": lambda: [asset.name for asset in main.assets]},
+    "/news/{slug}": {"slug": lambda: [article.slug for article in main.news_store]},
+    # Page 1 is /news itself; /news/page/1 only redirects there.
+    "/news/page/{number}": {"number": lambda: [str(number) for number in range(2, main.news_store.page_count() + 1)]},
+}
+
+
+def iter_paths(app):
+    for route in app.routes:
+        if not isinstance(route, APIRoute) or "GET" not in route.methods:
+            continue
+        if route.path.startswith(DYNAMIC_PREFIXES):
+            continue
+        params = _PARAM.findall(route.path)
+        if not params:
+            yield route.path
+            continue
+        if any(converter == ":path" for _, converter in params):
+            continue
+        expansions = PARAMS.get(route.path)
+        if expansions is None:
+            continue
+        # Only single-parameter routes exist so far.
+        (name, _), = params
+        for value in expansions[name]():
+            yield route.path.replace("{" + name + "}", value)
+
+
+def output_file(out_dir: Path, path: str) -> Path:
+    if path == NOT_FOUND_PATH:
+        return out_dir / "404.html"
+    relative = path.strip("/")
+    if Path(relative).suffix:
+        return out_dir / relative
+    return out_dir / relative / "index.html"
+
+
+async def export(out_dir: Path, app=main.app) -> dict:
+    manifest = {}
+    for path in [*iter_paths(app), NOT_FOUND_PATH]:
+        status, raw_headers, body = await request(app, path, headers=[("accept-encoding", "identity")], internal=True)
+        headers = {key.decode("latin-1"): value.decode("latin-1") for key, value in raw_headers}
+        target = output_file(out_dir, path)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_bytes(body)
+        encodings = {}
+        for coding, data in compress_variants(body).items():
+            target.with_name(target.name + EXTENSIONS[coding]).write_bytes(data)
+            encodings[coding] = len(data)
+        manifest[path if path != NOT_FOUND_PATH else "404"] = {
+            "file": target.relative_to(out_dir).as_posix(),
+            "status": status,
+            "content_type": headers.get("content-type"),
+            "etag": headers.get("etag"),
+            "cache_control": headers.get("cache-control"),
+            "link": headers.get("link"),
+            "size": len(body),
+            "encodings": encodings,
+        }
+    shutil.copytree(main.STATIC_DIR, out_dir / "static", dirs_exist_ok=True)
+    (out_dir / "manifest.json").write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+    return manifest
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("out_dir", type=Path)
+    parser.add_argument("--clean", action="store_true", help="remove out_dir before exporting")
+    args = parser.parse_args(argv)
+    if args.clean and args.out_dir.exists():
+        shutil.rmtree(args.out_dir)
+    args.out_dir.mkdir(parents=True, exist_ok=True)
+    manifest = asyncio.run(export(args.out_dir))
+    print(f"Exported {len(manifest)} pages to {args.out_dir}")
+
+
+if __name__ == "__main__":
+    main_cli()
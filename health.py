@@ -0,0 +1,105 @@
+"""Liveness and readiness probes, startup warm-up and shutdown draining.
+
+/healthz and /readyz are answered by the outermost middleware from
+prebuilt messages, before routing, metrics or anything else runs, so
+load-balancer probes cost next to nothing. /readyz only reports ready once
+the lifespan has warmed every page, and goes back to 503 as soon as the
+worker is asked to stop. At that point the callbacks registered with
+`on_drain` run, to end long-lived streams that would otherwise hold the
+graceful shutdown open until its timeout.
+"""
+import asyncio
+import logging
+import signal
+import threading
+import time
+
+from inprocess import request, text_response
+
+
+logger = logging.getLogger(__name__)
+
+
+ALIVE = text_response(200, "ok")
+READY = text_response(200, "ready")
+WARMING_UP = text_response(503, "warming up")
+DRAINING = text_response(503, "draining")
+
+
+class Health:
+    def __init__(self):
+        self.ready = False
+        self.draining = False
+        self._drain_callbacks = []
+        self._loop = None
+
+    def on_drain(self, callback):
+        self._drain_callbacks.append(callback)
+
+    def begin_drain(self):
+        if self.draining:
+            return
+        self.draining = True
+        for callback in self._drain_callbacks:
+            try:
+                callback()
+            except Exception:
+                logger.exception("Drain callback %r failed", callback)
+
+    def watch_signals(self):
+        """Start draining on SIGTERM/SIGINT, then let the server's own handler shut it down as usual."""
+        if threading.current_thread() is not threading.main_thread():
+            return
+        self._loop = asyncio.get_running_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            previous = signal.getsignal(signum)
+            if not callable(previous):
+                continue
+
+            def handler(signum, frame, previous=previous):
+                # Signal handlers may run in the middle of the event loop; hop onto it instead.
+                self._loop.call_soon_threadsafe(self.begin_drain)
+                previous(signum, frame)
+
+            signal.signal(signum, handler)
+
+    def probe(self, path: str) -> tuple | None:
+        if path == "/healthz":
+            return ALIVE
+        if path == "/readyz":
+            if self.draining:
+                return DRAINING
+            return READY if self.ready else WARMING_UP
+        return None
+
+
+class HealthMiddleware:
+    def __init__(self, app, health: Health):
+        self.app = app
+        self.health = health
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            messages = self.health.probe(scope["path"])
+            if messages is not None:
+                await send(messages[0])
+                await send(messages[1])
+                return
+        await self.app(scope, receive, send)
+
+
+async def warm_up(app, paths) -> int:
+    """Request every path once through the app so its page is rendered and cached; returns how many failed."""
+    started = time.perf_counter()
+    failed = 0
+    for path in paths:
+        try:
+            status, _, _ = await request(app, path, headers=[("user-agent", "warm-up")], internal=True)
+        except Exception:
+            logger.exception("Warm-up request for %s failed", path)
+            status = 500
+        if status >= 500:
+            failed += 1
+            logger.error("Warm-up request for %s failed with %d", path, status)
+    logger.info("Warmed up %d pages in %.0f ms", len(paths), (time.perf_counter() - started) * 1000)
+    return failed
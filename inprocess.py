@@ -0,0 +1,72 @@
+from urllib.parse import urlsplit
+
+
+# Scope key set on requests the server makes of itself, so logging and metrics can leave them out.
+INTERNAL = "internal"
+
+
+def text_response(status: int, text: str, headers=()) -> tuple:
+    """Prebuilt, uncacheable plain-text (start, body) messages for middleware that answers without the app."""
+    body = text.encode("utf-8")
+    start = {
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"text/plain; charset=utf-8"),
+            (b"content-length", str(len(body)).encode("latin-1")),
+            *headers,
+            (b"cache-control", b"no-store"),
+        ],
+    }
+    return start, {"type": "http.response.body", "body": body}
+
+
+async def request(
+    app,
+    path: str,
+    method: str = "GET",
+    headers=(),
+    body: bytes = b"",
+    client=("127.0.0.1", 50000),
+    internal: bool = False,
+):
+    """Run one HTTP request through an ASGI app without a server or socket.
+
+    Returns (status, headers, body) with headers as a list of (bytes, bytes).
+    `internal` marks the request as the server's own (warm-up, indexing)
+    rather than traffic, e.g. from bench.py, that should be measured.
+    """
+    url = urlsplit(path)
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": url.path,
+        "raw_path": url.path.encode("utf-8"),
+        "query_string": url.query.encode("latin-1"),
+        "root_path": "",
+        "headers": [(b"host", b"localhost"), *((k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers)],
+        "client": client,
+        "server": ("localhost", 80),
+        "state": {},
+        INTERNAL: internal,
+    }
+    pending = [{"type": "http.request", "body": body, "more_body": False}]
+    response = {"status": None, "headers": [], "body": []}
+
+    async def receive():
+        if pending:
+            return pending.pop()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            response["headers"] = message.get("headers", [])
+        elif message["type"] == "http.response.body":
+            response["body"].append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return response["status"], response["headers"], b"".join(response["body"])
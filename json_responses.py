@@ -0,0 +1,65 @@
+"""Fast JSON and msgpack responses for the API endpoints.
+
+Handlers that return a plain dict go through FastAPI's jsonable_encoder walk
+and then json.dumps. The API handlers instead build their payload from
+known-safe types (str, int, float, bool, None, lists, dicts and number
+arrays) and return FastJSONResponse themselves, which hands it straight to
+orjson. orjson writes NumPy arrays natively, so /api/random never converts
+them to lists. Without orjson installed the stdlib json module is used.
+"""
+import json
+
+from fastapi.responses import JSONResponse, Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+MSGPACK = "application/msgpack"
+
+
+def _default(value):
+    # NumPy arrays and scalars (when orjson is not doing it), array.array from the stdlib backend.
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    raise TypeError(f"Type is not serializable: {type(value).__name__}")
+
+
+if orjson is not None:
+    _OPTIONS = orjson.OPT_SERIALIZE_NUMPY
+
+    def dumps(payload) -> bytes:
+        return orjson.dumps(payload, default=_default, option=_OPTIONS)
+else:
+    def dumps(payload) -> bytes:
+        return json.dumps(payload, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+class MsgpackResponse(Response):
+    media_type = MSGPACK
+
+    def render(self, content) -> bytes:
+        return msgpack.packb(content, default=_default)
+
+
+def wants_msgpack(request) -> bool:
+    return msgpack is not None and MSGPACK in request.headers.get("accept", "")
+
+
+def negotiated(request, content, status_code: int = 200, headers: dict | None = None) -> Response:
+    """msgpack for clients that send Accept: application/msgpack (when available), JSON for everyone else."""
+    response_class = MsgpackResponse if wants_msgpack(request) else FastJSONResponse
+    headers = {**headers, "vary": "Accept"} if headers else {"vary": "Accept"}
+    return response_class(content, status_code=status_code, headers=headers)
@@ -1,415 +1,370 @@
 
-from fastapi import FastAPI, Request
-import uvicorn
+from fastapi import FastAPI, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.exceptions import RequestValidationError
+from contextlib import asynccontextmanager
 from datetime import datetime
-from fastapi.responses import HTMLResponse
+from functools import lru_cache
+from html import escape
+from pathlib import Path
+from typing import Literal
+from fastapi.responses import HTMLResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
+from urllib.parse import parse_qsl
+import asyncio
+import json
+import os
 import random
 
-app = FastAPI()
+import json_responses
+import random_numbers
+import user_agents
+from access_log import AccessLog, AccessLogMiddleware
+from assets import AssetRegistry
+from branches import BranchRegistry
+from cache_backends import LRUCache, RedisCache
+from health import Health, HealthMiddleware, warm_up
+from json_responses import MSGPACK, FastJSONResponse, MsgpackResponse, negotiated
+from media import MediaLibrary, font_links
+from metrics import MetricsMiddleware, MetricsRegistry
+from news import NewsStore
+from preload import EarlyHints, EarlyHintsMiddleware, Preloads
+from random_stream import RandomTicker, StreamUnavailable
+from random_numbers import RandomNumber, RandomNumbers
+from ratelimit import RateLimiter, RateLimitMiddleware, TokenBuckets, parse_policies, rejection
+from render_cache import PageCache
+from search import SearchIndex, SearchResults, index_site
+from submissions import ContactSubmission, SubmissionWriter, open_store
+from templates import Template
+from user_agents import UserAgentBatch, UserAgentInfo, UserAgentResults
 
-def get_base_html(title: str, content: str):
+BASE_DIR = Path(__file__).resolve().parent
+STATIC_DIR = BASE_DIR / "static"
+TEMPLATES_DIR = BASE_DIR / "templates"
+
+contact_writer = SubmissionWriter(
+    open_store(BASE_DIR / os.environ.get("CONTACTS_STORE", "var/contacts.sqlite3")),
+    max_queue=int(os.environ.get("CONTACTS_QUEUE_SIZE", "10000")),
+)
+
+health = Health()
+
+news_store = NewsStore(BASE_DIR / "data" / "news", os.environ.get("SITE_URL", "http://localhost:8000"))
+news_store.refresh()
+
+search_index = SearchIndex()
+
+def news_changed(slugs: set):
+    for slug in slugs:
+        article = news_store.get(slug)
+        if article is None:
+            # Pages of removed articles would otherwise sit in the cache until evicted.
+            page_cache.invalidate(f"article:{slug}")
+            search_index.remove(f"/news/{slug}")
+        else:
+            search_index.update(f"/news/{slug}", article.title, article.content)
+
+def warm_up_paths() -> list:
+    # Imported here: export imports this module.
+    from export import NOT_FOUND_PATH, iter_paths
+
+    return [*iter_paths(app), "/branches/__warm-up__", NOT_FOUND_PATH]
+
+def search_paths() -> list:
+    from export import iter_paths
+
+    # News list pages only repeat the articles' summaries.
+    return [path for path in iter_paths(app) if path != "/news" and not path.startswith("/news/page/")]
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    health.watch_signals()
+    await contact_writer.start()
+    await metrics.start()
+    if access_log is not None:
+        await access_log.start()
+    if os.environ.get("WARMUP", "1") != "0":
+        await warm_up(app, warm_up_paths())
+    await index_site(app, search_index, search_paths())
+    poll_interval = float(os.environ.get("NEWS_POLL_INTERVAL", "5"))
+    news_watcher = asyncio.create_task(news_store.watch(poll_interval, news_changed)) if poll_interval > 0 else None
+    health.ready = True
+    yield
+    health.begin_drain()
+    if news_watcher is not None:
+        news_watcher.cancel()
+    await contact_writer.stop()
+    await metrics.stop()
+    if access_log is not None:
+        await access_log.stop()
+    if page_cache.shared is not None:
+        await page_cache.shared.close()
+
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
+
+random_ticker = RandomTicker.from_env()
+health.on_drain(random_ticker.close)
+
+metrics = MetricsRegistry(os.environ.get("METRICS_DIR"))
+if os.environ.get("METRICS", "1") != "0":
+    app.add_middleware(MetricsMiddleware, registry=metrics)
+
+early_hints = None
+if os.environ.get("EARLY_HINTS", "1") != "0":
+    early_hints = EarlyHints()
+    # Inside the rate limiter, so requests it turns away are not sent preloads first.
+    app.add_middleware(EarlyHintsMiddleware, hints=early_hints)
+
+# Per-client limits for the endpoints that are cheap to hammer: "prefix=rate/burst", comma separated.
+RATE_LIMITS = os.environ.get(
+    "RATE_LIMITS",
+    "/api/random=50/100,/api/user-agent=50/100,/api/search=20/40,/management/=5/20,/about/=5/20,/contacts/=5/20",
+)
+rate_limiter = RateLimiter(
+    parse_policies(RATE_LIMITS, float(os.environ.get("RATE_LIMIT_SCALE", "1"))),
+    max_concurrency=int(os.environ.get("MAX_CONCURRENCY", "256")),
+    api_keys=[key for key in os.environ.get("API_KEYS", "").split(",") if key],
+)
+if os.environ.get("RATE_LIMIT", "1") != "0":
+    # Outside metrics, so shed requests cost as little as possible.
+    app.add_middleware(RateLimitMiddleware, limiter=rate_limiter)
+
+access_log = None
+if os.environ.get("ACCESS_LOG", "1") != "0":
+    access_log = AccessLog(
+        BASE_DIR / os.environ.get("ACCESS_LOG_DIR", "var/log"),
+        max_bytes=int(os.environ.get("ACCESS_LOG_MAX_BYTES", str(64 * 1024 * 1024))),
+        backups=int(os.environ.get("ACCESS_LOG_BACKUPS", "20")),
+        compress=os.environ.get("ACCESS_LOG_COMPRESS", "1") != "0",
+    )
+    # Outside the rate limiter, so 429s and shed requests are logged too.
+    app.add_middleware(AccessLogMiddleware, log=access_log)
+
+# Added last so it is outermost: probes never reach routing or metrics.
+app.add_middleware(HealthMiddleware, health=health)
+
+app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
+
+media = MediaLibrary(STATIC_DIR / "media", "/static/media")
+
+assets = AssetRegistry()
+# The hero background is the largest paint on the home and 404 pages, so it is self-hosted like the <img>s.
+SITE_CSS = assets.add(STATIC_DIR / "css" / "site.css", transform=media.css_urls)
+FONTS_CSS_PATH = STATIC_DIR / "css" / "fonts.css"
+FONT_LINKS = font_links(assets, FONTS_CSS_PATH)
+
+branches = BranchRegistry.load(BASE_DIR / "data" / "branches.json")
+
+LAYOUT = Template.load(TEMPLATES_DIR / "base.html").bind(
+    font_links=FONT_LINKS,
+    stylesheet=SITE_CSS.url,
+    nav=Template.load(TEMPLATES_DIR / "nav.html"),
+)
+FOOTER = Template.load(TEMPLATES_DIR / "footer.html")
+
+@lru_cache(maxsize=2)
+def layout_for_year(year: int) -> Template:
+    return LAYOUT.bind(footer=FOOTER.bind(year=str(year)))
+
+@lru_cache(maxsize=1024)
+def page_title(title: str) -> str:
+    return escape(title)
+
+def get_base_html(title: str, content: str) -> bytes:
+    return layout_for_year(datetime.now().year).render(title=page_title(title), content=content)
+
+def render_uncached(title: str, content: str) -> bytes:
+    # For pages that are never cached, so one-off bodies do not push page fragments out of encode_fragment.
+    return layout_for_year(datetime.now().year).render_once(title=escape(title), content=content)
+
+def stream_base_html(title: str, content):
+    if isinstance(content, str):
+        # Wrapped so the head and nav are flushed before the body.
+        content = (content,)
+    return layout_for_year(datetime.now().year).stream(title=page_title(title), content=content)
+
+CACHE_CONTROL = {
+    "home": "public, max-age=300",
+    "news": "public, max-age=60",
+    "article": "public, max-age=300",
+    "feed": "public, max-age=300",
+    "management": "public, max-age=3600",
+    "about": "public, max-age=3600",
+    "contacts": "public, max-age=3600",
+    "branches": "public, max-age=3600",
+    "branch": "public, max-age=3600",
+    "branch-not-found": "public, max-age=60",
+    "not-found": "public, max-age=60",
+}
+
+STREAM_PAGES = {name for name in os.environ.get("STREAM_PAGES", "").split(",") if name}
+
+PAGE_CACHE_URL = os.environ.get("PAGE_CACHE_URL")
+
+# Page groups whose responses carry Link: rel=preload headers: "*" for all, empty for none.
+PRELOAD_PAGES = os.environ.get("PRELOAD_PAGES", "*")
+preloads = Preloads(
+    get_base_html("", "").decode("utf-8"),
+    pages=None if PRELOAD_PAGES == "*" else [name for name in PRELOAD_PAGES.split(",") if name],
+    images=[name for name in os.environ.get("PRELOAD_IMAGES", "branch,branches").split(",") if name],
+)
+
+page_cache = PageCache(
+    get_base_html,
+    CACHE_CONTROL,
+    stream=stream_base_html,
+    streamed=STREAM_PAGES,
+    # Crawlers gain nothing from an early head flush; they get the cached, compressed page.
+    prefer_cached=lambda request: user_agents.is_bot(request.headers.get("user-agent")),
+    local=LRUCache(
+        max_entries=int(os.environ.get("PAGE_CACHE_MAX_ENTRIES", "10000")),
+        max_bytes=int(os.environ.get("PAGE_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+        ttl=float(os.environ.get("PAGE_CACHE_TTL", "0")) or None,
+    ),
+    shared=RedisCache(PAGE_CACHE_URL) if PAGE_CACHE_URL else None,
+    preload=preloads,
+)
+metrics.add_collector(lambda: [
+    ("page_cache_hits_total", "counter", "Pages served from the render cache.", page_cache.hits),
+    ("page_cache_misses_total", "counter", "Pages rendered because they were not cached.", page_cache.misses),
+    ("page_cache_shared_hits_total", "counter", "Pages taken from the shared cache tier instead of rendered.", page_cache.shared_hits),
+    ("page_cache_not_modified_total", "counter", "Conditional requests answered with 304.", page_cache.not_modified),
+    ("user_agent_cache_hits_total", "counter", "User-Agent strings answered from the parse cache.", user_agents.cache_stats()["hits"]),
+    ("user_agent_cache_misses_total", "counter", "User-Agent strings parsed.", user_agents.cache_stats()["misses"]),
+])
+
+def contact_metrics() -> list:
+    stats = contact_writer.stats()
+    return [
+        ("contact_submissions_accepted_total", "counter", "Contact submissions queued.", stats["accepted"]),
+        ("contact_submissions_rejected_total", "counter", "Contact submissions shed because the queue was full.", stats["rejected"]),
+        ("contact_submissions_written_total", "counter", "Contact submissions persisted.", stats["written"]),
+        ("contact_submissions_batches_total", "counter", "Batches of contact submissions written, one commit or fsync each.", stats["batches"]),
+        ("contact_submissions_queued", "gauge", "Contact submissions waiting to be written.", stats["queued"]),
+    ]
+
+metrics.add_collector(contact_metrics)
+
+def random_stream_metrics() -> list:
+    stats = random_ticker.stats()
+    return [
+        ("random_stream_subscribers", "gauge", "Open /api/random streams.", stats["subscribers"]),
+        ("random_stream_frames_total", "counter", "Frames handed to /api/random stream subscribers.", stats["frames_sent"]),
+        ("random_stream_frames_dropped_total", "counter", "Queued stream frames dropped because the client fell behind.", stats["frames_dropped"]),
+    ]
+
+metrics.add_collector(random_stream_metrics)
+
+def rate_limit_metrics() -> list:
+    stats = rate_limiter.stats()
+    return [
+        ("rate_limited_total", "counter", "Requests answered 429 by a per-client rate limit.", stats["limited"]),
+        ("load_shed_total", "counter", "Requests answered 503 because too many were in flight.", stats["shed"]),
+    ]
+
+metrics.add_collector(rate_limit_metrics)
+
+if early_hints is not None:
+    metrics.add_collector(lambda: [
+        ("early_hints_sent_total", "counter", "103 Early Hints responses sent ahead of a page.", early_hints.stats()["sent"]),
+    ])
+if page_cache.shared is not None:
+    metrics.add_collector(lambda: [
+        ("page_cache_shared_errors_total", "counter", "Shared cache commands that failed or timed out.", page_cache.shared.errors),
+    ])
+
+def access_log_metrics() -> list:
+    stats = access_log.stats()
+    return [
+        ("access_log_records_total", "counter", "Requests recorded in the access log.", stats["recorded"]),
+        ("access_log_dropped_total", "counter", "Access log records dropped because the buffer was full.", stats["dropped"]),
+        ("access_log_written_total", "counter", "Access log records written to disk.", stats["written"]),
+        ("access_log_rotations_total", "counter", "Access log files rotated.", stats["rotations"]),
+        ("access_log_buffered", "gauge", "Access log records waiting to be written.", stats["buffered"]),
+    ]
+
+if access_log is not None:
+    metrics.add_collector(access_log_metrics)
+
+def render_branch_links() -> str:
+    return "\n".join(
+        f'            <li><a href="/branches/{escape(branch["city"])}">{escape(branch["name"])}</a></li>'
+        for branch in branches
+    )
+
+def render_branch_card(branch: dict) -> str:
     return f"""
-    <!DOCTYPE html>
-    <html lang="ru">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>{title} | XYZ Company</title>
-        <link rel="preconnect" href="https://fonts.googleapis.com">
-        <link rel="preconnect" href="https://fonts.gstatic.com" crossorigin>
-        <link href="https://fonts.googleapis.com/css2?family=Montserrat:wght@400;600;700&family=Roboto:wght@300;400;500&display=swap" rel="stylesheet">
-        <style>
-            :root {{
-                --primary: #2563eb;
-                --primary-dark: #1d4ed8;
-                --secondary: #f59e0b;
-                --dark: #1e293b;
-                --light: #f8fafc;
-                --gray: #94a3b8;
-                --success: #10b981;
-            }}
-            
-            * {{
-                margin: 0;
-                padding: 0;
-                box-sizing: border-box;
-            }}
-            
-            body {{
-                font-family: 'Roboto', sans-serif;
-                line-height: 1.6;
-                color: var(--dark);
-                background-color: var(--light);
-                min-height: 100vh;
-                display: flex;
-                flex-direction: column;
-            }}
-            
-            header {{
-                background: linear-gradient(135deg, var(--primary), var(--primary-dark));
-                color: white;
-                box-shadow: 0 4px 6px -1px rgba(0, 0, 0, 0.1);
-                position: sticky;
-                top: 0;
-                z-index: 100;
-            }}
-            
-            nav {{
-                max-width: 1200px;
-                margin: 0 auto;
-                padding: 1rem 2rem;
-            }}
-            
-            .nav-container {{
-                display: flex;
-                justify-content: space-between;
-                align-items: center;
-            }}
-            
-            .logo {{
-                font-family: 'Montserrat', sans-serif;
-                font-weight: 700;
-                font-size: 1.5rem;
-                color: white;
-                text-decoration: none;
-                display: flex;
-                align-items: center;
-                gap: 0.5rem;
-            }}
-            
-            .logo-icon {{
-                font-size: 2rem;
-            }}
-            
-            .nav-links {{
-                display: flex;
-                gap: 1.5rem;
-            }}
-            
-            .nav-links a {{
-                color: white;
-                text-decoration: none;
-                font-weight: 500;
-                font-family: 'Montserrat', sans-serif;
-                padding: 0.5rem 1rem;
-                border-radius: 0.5rem;
-                transition: all 0.3s ease;
-                position: relative;
-            }}
-            
-            .nav-links a:hover {{
-                background-color: rgba(255, 255, 255, 0.1);
-            }}
-            
-            .nav-links a::after {{
-                content: '';
-                position: absolute;
-                bottom: 0;
-                left: 50%;
-                width: 0;
-                height: 2px;
-                background-color: var(--secondary);
-                transition: all 0.3s ease;
-            }}
-            
-            .nav-links a:hover::after {{
-                width: 100%;
-                left: 0;
-            }}
-            
-            main {{
-                flex: 1;
-                max-width: 1200px;
-                margin: 2rem auto;
-                padding: 0 2rem;
-                width: 100%;
-            }}
-            
-            .hero {{
-                background: linear-gradient(rgba(0, 0, 0, 0.6), rgba(0, 0, 0, 0.6)), url('https://images.unsplash.com/photo-1450101499163-c8848c66ca85?ixlib=rb-4.0.3&auto=format&fit=crop&w=1350&q=80');
-                background-size: cover;
-                background-position: center;
-                color: white;
-                padding: 5rem 2rem;
-                border-radius: 1rem;
-                margin-bottom: 2rem;
-                text-align: center;
-                animation: fadeIn 1s ease-in-out;
-            }}
-            
-            @keyframes fadeIn {{
-                from {{ opacity: 0; transform: translateY(20px); }}
-                to {{ opacity: 1; transform: translateY(0); }}
-            }}
-            
-            h1 {{
-                font-family: 'Montserrat', sans-serif;
-                font-size: 2.5rem;
-                margin-bottom: 1rem;
-                color: var(--primary-dark);
-            }}
-            
-            h2 {{
-                font-family: 'Montserrat', sans-serif;
-                font-size: 1.8rem;
-                margin: 1.5rem 0 1rem;
-                color: var(--primary);
-            }}
-            
-            h3 {{
-                font-family: 'Montserrat', sans-serif;
-                font-size: 1.4rem;
-                margin: 1.2rem 0 0.8rem;
-            }}
-            
-            p {{
-                margin-bottom: 1rem;
-            }}
-            
-            .btn {{
-                display: inline-block;
-                background-color: var(--primary);
-                color: white;
-                padding: 0.7rem 1.5rem;
-                border-radius: 0.5rem;
-                text-decoration: none;
-                font-weight: 500;
-                transition: all 0.3s ease;
-                border: none;
-                cursor: pointer;
-                font-family: 'Montserrat', sans-serif;
-                margin: 0.5rem 0;
-            }}
-            
-            .btn:hover {{
-                background-color: var(--primary-dark);
-                transform: translateY(-2px);
-                box-shadow: 0 4px 6px -1px rgba(0, 0, 0, 0.1);
-            }}
-            
-            .btn-secondary {{
-                background-color: var(--secondary);
-            }}
-            
-            .btn-secondary:hover {{
-                background-color: #e69009;
-            }}
-            
-            .card {{
-                background-color: white;
-                border-radius: 0.5rem;
-                padding: 1.5rem;
-                box-shadow: 0 4px 6px -1px rgba(0, 0, 0, 0.1);
-                margin-bottom: 1.5rem;
-                transition: transform 0.3s ease, box-shadow 0.3s ease;
-            }}
-            
-            .card:hover {{
-                transform: translateY(-5px);
-                box-shadow: 0 10px 15px -3px rgba(0, 0, 0, 0.1);
-            }}
-            
-            .grid {{
-                display: grid;
-                grid-template-columns: repeat(auto-fill, minmax(300px, 1fr));
-                gap: 1.5rem;
-                margin: 2rem 0;
-            }}
-            
-            .member {{
-                text-align: center;
-                padding: 1.5rem;
-            }}
-            
-            .member img {{
-                width: 150px;
-                height: 150px;
-                border-radius: 50%;
-                object-fit: cover;
-                margin-bottom: 1rem;
-                border: 5px solid var(--primary);
-            }}
-            
-            .contact-info {{
-                background-color: white;
-                padding: 2rem;
-                border-radius: 0.5rem;
-                box-shadow: 0 4px 6px -1px rgba(0, 0, 0, 0.1);
-                margin: 2rem 0;
-            }}
-            
-            .contact-info p {{
-                margin-bottom: 0.8rem;
-                display: flex;
-                align-items: center;
-                gap: 0.5rem;
-            }}
-            
-            .contact-info i {{
-                color: var(--primary);
-                font-size: 1.2rem;
-            }}
-            
-            footer {{
-                background-color: var(--dark);
-                color: white;
-                text-align: center;
-                padding: 2rem;
-                margin-top: 2rem;
-            }}
-            
-            .social-links {{
-                display: flex;
-                justify-content: center;
-                gap: 1rem;
-                margin: 1rem 0;
-            }}
-            
-            .social-links a {{
-                color: white;
-                font-size: 1.5rem;
-                transition: color 0.3s ease;
-            }}
-            
-            .social-links a:hover {{
-                color: var(--secondary);
-            }}
-            
-            .branch-card {{
-                position: relative;
-                overflow: hidden;
-                height: 300px;
-                border-radius: 0.5rem;
-            }}
-            
-            .branch-image {{
-                width: 100%;
-                height: 100%;
-                object-fit: cover;
-                transition: transform 0.5s ease;
-            }}
-            
-            .branch-card:hover .branch-image {{
-                transform: scale(1.1);
-            }}
-            
-            .branch-overlay {{
-                position: absolute;
-                bottom: 0;
-                left: 0;
-                right: 0;
-                background: linear-gradient(transparent, rgba(0, 0, 0, 0.8));
-                padding: 1.5rem;
-                color: white;
-            }}
-            
-            .branch-overlay h3 {{
-                color: white;
-                margin-bottom: 0.5rem;
-            }}
-            
-            .quick-links {{
-                background-color: white;
-                padding: 1.5rem;
-                border-radius: 0.5rem;
-                box-shadow: 0 4px 6px -1px rgba(0, 0, 0, 0.1);
-                margin: 2rem 0;
-            }}
-            
-            .quick-links h3 {{
-                margin-bottom: 1rem;
-                color: var(--primary);
-            }}
-            
-            .quick-links ul {{
-                list-style-type: none;
-                display: flex;
-                flex-wrap: wrap;
-                gap: 1rem;
-            }}
-            
-            .quick-links li {{
-                background-color: var(--light);
-                padding: 0.5rem 1rem;
-                border-radius: 0.5rem;
-                transition: all 0.3s ease;
-            }}
-            
-            .quick-links li:hover {{
-                background-color: var(--primary);
-            }}
-            
-            .quick-links li:hover a {{
-                color: white;
-            }}
-            
-            .quick-links a {{
-                color: var(--dark);
-                text-decoration: none;
-                font-weight: 500;
-            }}
+        <div class="card branch-card">
+            <img {media.img_attrs(branch['image'], '(max-width: 768px) 100vw, 33vw')} alt="{escape(branch['name'])}" class="branch-image" loading="lazy">
+            <div class="branch-overlay">
+                <h3>{escape(branch['name'])}</h3>
+                <p>{escape(branch['tagline'])}</p>
+                <a href="/branches/{escape(branch['city'])}" class="btn" style="padding: 0.5rem 1rem; font-size: 0.9rem; margin-top: 0.5rem;">Подробнее</a>
+            </div>
+        </div>
+        """
+
+def render_branch_detail(branch: dict) -> str:
+    return f"""
+        <div class="card" style="position: relative; overflow: hidden; padding: 0;">
+            <img {media.img_attrs(branch['image'], '100vw')} alt="{escape(branch['title'])}" style="width: 100%; height: 400px; object-fit: cover;">
+            <div style="position: absolute; bottom: 0; left: 0; right: 0; background: linear-gradient(transparent, rgba(0, 0, 0, 0.8)); padding: 2rem; color: white;">
+                <h1 style="color: white;">{escape(branch['title'])}</h1>
+            </div>
+        </div>
+        
+        <div class="grid" style="margin-top: 2rem; grid-template-columns: 1fr 1fr;">
+            <div class="card">
+                <h2>Контактная информация</h2>
+                <p><strong>Адрес:</strong> {escape(branch['address'])}</p>
+                <p><strong>Телефон:</strong> {escape(branch['phone'])}</p>
+                <p><strong>Email:</strong> {escape(branch['email'])}</p>
+                <p><strong>Менеджер филиала:</strong> {escape(branch['manager'])}</p>
+                <p><strong>Количество сотрудников:</strong> {escape(branch['employees'])}</p>
+                <a href="/contacts" class="btn" style="padding: 0.5rem 1rem; font-size: 0.9rem; margin-top: 1rem;">Связаться с нами</a>
+            </div>
             
-            @media (max-width: 768px) {{
-                .nav-container {{
-                    flex-direction: column;
-                    gap: 1rem;
-                }}
-                
-                .nav-links {{
-                    flex-direction: column;
-                    gap: 0.5rem;
-                    width: 100%;
-                }}
-                
-                .nav-links a {{
-                    display: block;
-                    text-align: center;
-                }}
-                
-                .grid {{
-                    grid-template-columns: 1fr;
-                }}
-            }}
-        </style>
-    </head>
-    <body>
-        <header>
-            <nav>
-                <div class="nav-container">
-                    <a href="/" class="logo">
-                        <span class="logo-icon">🏢</span>
-                        <span>XYZ Company</span>
-                    </a>
-                    <div class="nav-links">
-                        <a href="/">Главная</a>
-                        <a href="/news">Новости</a>
-                        <a href="/management">Руководство</a>
-                        <a href="/about">О компании</a>
-                        <a href="/branches">Филиалы</a>
-                        <a href="/contacts">Контакты</a>
-                    </div>
-                </div>
-            </nav>
-        </header>
-        <main>
-            {content}
-        </main>
-        <footer>
-            <div class="social-links">
-                <a href="#" aria-label="Facebook">📘</a>
-                <a href="#" aria-label="Twitter">🐦</a>
-                <a href="#" aria-label="Instagram">📷</a>
-                <a href="#" aria-label="LinkedIn">💼</a>
+            <div class="card">
+                <h2>О филиале</h2>
+                <p>{escape(branch['description'])}</p>
+                <h3 style="margin-top: 1.5rem;">Основные направления</h3>
+                <p>{escape(branch['services'])}</p>
+                <a href="/branches" class="btn btn-secondary" style="padding: 0.5rem 1rem; font-size: 0.9rem; margin-top: 1rem;">Все филиалы</a>
             </div>
-            <p>© Компания XYZ, {datetime.now().year}. Все права защищены.</p>
-        </footer>
-    </body>
-    </html>
-    """
+        </div>
+        
+        <div class="quick-links">
+            <h3>Другие филиалы</h3>
+            <ul>
+{BRANCH_LINKS}
+            </ul>
+        </div>
+        
+        <div class="card">
+            <h2>Форма для связи с филиалом</h2>
+            <form method="post" action="/branches/{escape(branch['city'])}/contact" style="display: grid; gap: 1rem; margin-top: 1rem;">
+                <div>
+                    <label for="name" style="display: block; margin-bottom: 0.5rem; font-weight: 500;">Ваше имя</label>
+                    <input type="text" id="name" name="name" required maxlength="200" style="width: 100%; padding: 0.7rem; border: 1px solid var(--gray); border-radius: 0.5rem;">
+                </div>
+                <div>
+                    <label for="email" style="display: block; margin-bottom: 0.5rem; font-weight: 500;">Email</label>
+                    <input type="email" id="email" name="email" required maxlength="320" style="width: 100%; padding: 0.7rem; border: 1px solid var(--gray); border-radius: 0.5rem;">
+                </div>
+                <div>
+                    <label for="message" style="display: block; margin-bottom: 0.5rem; font-weight: 500;">Сообщение</label>
+                    <textarea id="message" name="message" rows="4" required maxlength="5000" style="width: 100%; padding: 0.7rem; border: 1px solid var(--gray); border-radius: 0.5rem;"></textarea>
+                </div>
+                <button type="submit" class="btn">Отправить</button>
+            </form>
+        </div>
+        """
+
+BRANCH_LINKS = render_branch_links()
+BRANCH_CARDS = "".join(render_branch_card(branch) for branch in branches)
+BRANCH_PAGES = {branch["city"]: render_branch_detail(branch) for branch in branches}
 
 @app.get("/", response_class=HTMLResponse)
-async def home():
+async def home(request: Request):
     content = """
     <section class="hero">
         <h1 style="color: white;">Инновации для вашего бизнеса</h1>
@@ -449,52 +404,39 @@ async def home():
         </ul>
     </section>
     """
-    return HTMLResponse(content=get_base_html("Главная", content))
+    return await page_cache.response(request, "home", "Главная", content)
 
 @app.get("/news", response_class=HTMLResponse)
-@app.get("/news/{path:path}", response_class=HTMLResponse)
-async def news():
-    content = """
-    <h1>Последние новости</h1>
-    
-    <div class="card">
-        <h2>Запуск нового продукта X-Tech</h2>
-        <p style="color: var(--gray); margin-bottom: 1.5rem;">15.10.2023</p>
-        <p>Мы рады представить наш новый продукт X-Tech, который революционизирует подход к управлению бизнес-процессами. Решение уже получило положительные отзывы от первых клиентов.</p>
-        <div style="display: flex; gap: 1rem; margin-top: 1rem;">
-            <a href="/about" class="btn" style="padding: 0.5rem 1rem; font-size: 0.9rem;">Подробнее о компании</a>
-            <a href="/contacts" class="btn btn-secondary" style="padding: 0.5rem 1rem; font-size: 0.9rem;">Запросить демо</a>
-        </div>
-    </div>
-    
-    <div class="card">
-        <h2>Открытие нового офиса в Москве</h2>
-        <p style="color: var(--gray); margin-bottom: 1.5rem;">01.09.2023</p>
-        <p>Сообщаем об открытии нового офиса в Москве в бизнес-центре "Серебряный город". Современное пространство площадью 2000 кв.м. позволит нам расширить команду и принимать больше клиентов.</p>
-        <a href="/branches" class="btn" style="padding: 0.5rem 1rem; font-size: 0.9rem;">Все филиалы</a>
-    </div>
-    
-    <div class="quick-links">
-        <h3>Другие разделы</h3>
-        <ul>
-            <li><a href="/management">Наше руководство</a></li>
-            <li><a href="/about">История компании</a></li>
-            <li><a href="/branches/London">Лондонский филиал</a></li>
-        </ul>
-    </div>
-    """
-    return HTMLResponse(content=get_base_html("Новости", content))
+async def news(request: Request):
+    return await page_cache.response(request, "news:1", "Новости", news_store.page(1))
 
-@app.get("/management", response_class=HTMLResponse)
-@app.get("/management/{path:path}", response_class=HTMLResponse)
-async def management():
-    content = """
+@app.get("/news/page/{number}", response_class=HTMLResponse)
+async def news_page(request: Request, number: int):
+    if number == 1:
+        return Response(status_code=301, headers={"location": "/news"})
+    content = news_store.page(number)
+    if content is None:
+        raise HTTPException(status_code=404)
+    return await page_cache.response(request, f"news:{number}", f"Новости, страница {number}", content)
+
+@app.get("/news/feed.atom")
+async def news_feed(request: Request):
+    return page_cache.document(request, "feed", news_store.feed(), "application/atom+xml; charset=utf-8")
+
+@app.get("/news/{slug}", response_class=HTMLResponse)
+async def news_article(request: Request, slug: str):
+    article = news_store.get(slug)
+    if article is None:
+        raise HTTPException(status_code=404)
+    return await page_cache.response(request, f"article:{slug}", article.title, article.content)
+
+MANAGEMENT_CONTENT = f"""
     <h1>Наша команда</h1>
     <p style="margin-bottom: 2rem;">Профессионалы с многолетним опытом работы в индустрии</p>
     
     <div class="grid">
         <div class="card member">
-            <img src="https://randomuser.me/api/portraits/men/32.jpg" alt="Иванов Иван">
+            <img {media.img_attrs("https://randomuser.me/api/portraits/men/32.jpg", "150px")} alt="Иванов Иван">
             <h3>Иванов Иван</h3>
             <p style="color: var(--primary); font-weight: 500;">Генеральный директор</p>
             <p>Основатель компании с более чем 15-летним опытом в IT и управлении бизнесом.</p>
@@ -502,7 +444,7 @@ async def management():
         </div>
         
         <div class="card member">
-            <img src="https://randomuser.me/api/portraits/women/44.jpg" alt="Петрова Мария">
+            <img {media.img_attrs("https://randomuser.me/api/portraits/women/44.jpg", "150px")} alt="Петрова Мария">
             <h3>Петрова Мария</h3>
             <p style="color: var(--primary); font-weight: 500;">Финансовый директор</p>
             <p>Специалист в области финансового менеджмента и стратегического планирования.</p>
@@ -510,7 +452,7 @@ async def management():
         </div>
         
         <div class="card member">
-            <img src="https://randomuser.me/api/portraits/men/75.jpg" alt="Сидоров Алексей">
+            <img {media.img_attrs("https://randomuser.me/api/portraits/men/75.jpg", "150px")} alt="Сидоров Алексей">
             <h3>Сидоров Алексей</h3>
             <p style="color: var(--primary); font-weight: 500;">Технический директор</p>
             <p>Эксперт в области разработки программного обеспечения и управления IT-проектами.</p>
@@ -527,11 +469,13 @@ async def management():
         </ul>
     </div>
     """
-    return HTMLResponse(content=get_base_html("Руководство", content))
+
+@app.get("/management", response_class=HTMLResponse)
+async def management(request: Request):
+    return await page_cache.response(request, "management", "Руководство", MANAGEMENT_CONTENT)
 
 @app.get("/about", response_class=HTMLResponse)
-@app.get("/about/{path:path}", response_class=HTMLResponse)
-async def about():
+async def about(request: Request):
     content = """
     <h1>О компании</h1>
     
@@ -569,12 +513,9 @@ async def about():
         </ul>
     </div>
     """
-    return HTMLResponse(content=get_base_html("О компании", content))
+    return await page_cache.response(request, "about", "О компании", content)
 
-@app.get("/contacts", response_class=HTMLResponse)
-@app.get("/contacts/{path:path}", response_class=HTMLResponse)
-async def contacts():
-    content = """
+CONTACTS_CONTENT = f"""
     <h1>Контакты</h1>
     
     <div class="contact-info">
@@ -609,66 +550,56 @@ async def contacts():
     <div class="quick-links">
         <h3>Наши филиалы</h3>
         <ul>
-            <li><a href="/branches/London">Лондон</a></li>
-            <li><a href="/branches/Paris">Париж</a></li>
-            <li><a href="/branches/Berlin">Берлин</a></li>
+{BRANCH_LINKS}
         </ul>
     </div>
     
     <div class="card">
         <h2>Форма обратной связи</h2>
-        <form style="display: grid; gap: 1rem; margin-top: 1rem;">
+        <form method="post" action="/contacts" style="display: grid; gap: 1rem; margin-top: 1rem;">
             <div>
                 <label for="name" style="display: block; margin-bottom: 0.5rem; font-weight: 500;">Ваше имя</label>
-                <input type="text" id="name" style="width: 100%; padding: 0.7rem; border: 1px solid var(--gray); border-radius: 0.5rem;">
+                <input type="text" id="name" name="name" required maxlength="200" style="width: 100%; padding: 0.7rem; border: 1px solid var(--gray); border-radius: 0.5rem;">
             </div>
             <div>
                 <label for="email" style="display: block; margin-bottom: 0.5rem; font-weight: 500;">Email</label>
-                <input type="email" id="email" style="width: 100%; padding: 0.7rem; border: 1px solid var(--gray); border-radius: 0.5rem;">
+                <input type="email" id="email" name="email" required maxlength="320" style="width: 100%; padding: 0.7rem; border: 1px solid var(--gray); border-radius: 0.5rem;">
             </div>
             <div>
                 <label for="message" style="display: block; margin-bottom: 0.5rem; font-weight: 500;">Сообщение</label>
-                <textarea id="message" rows="4" style="width: 100%; padding: 0.7rem; border: 1px solid var(--gray); border-radius: 0.5rem;"></textarea>
+                <textarea id="message" name="message" rows="4" required maxlength="5000" style="width: 100%; padding: 0.7rem; border: 1px solid var(--gray); border-radius: 0.5rem;"></textarea>
             </div>
             <button type="submit" class="btn" style="justify-self: start;">Отправить</button>
         </form>
     </div>
     """
-    return HTMLResponse(content=get_base_html("Контакты", content))
 
-@app.get("/branches", response_class=HTMLResponse)
-async def branches_list():
-    content = """
+# Shown above the form after a form post redirects back with ?sent=1; cached as its own page variant.
+SENT_NOTICE = """
+    <div class="card" role="status" style="border-left: 4px solid var(--primary);">
+        <h2>Спасибо! Ваше сообщение отправлено</h2>
+        <p>Мы свяжемся с вами в ближайшее время.</p>
+    </div>
+    """
+
+CONTACTS_SENT_CONTENT = SENT_NOTICE + CONTACTS_CONTENT
+BRANCH_SENT_PAGES = {city: SENT_NOTICE + content for city, content in BRANCH_PAGES.items()}
+
+def was_sent(request: Request) -> bool:
+    return request.query_params.get("sent") == "1"
+
+@app.get("/contacts", response_class=HTMLResponse)
+async def contacts(request: Request):
+    if was_sent(request):
+        return await page_cache.response(request, "contacts:sent", "Контакты", CONTACTS_SENT_CONTENT)
+    return await page_cache.response(request, "contacts", "Контакты", CONTACTS_CONTENT)
+
+BRANCHES_LIST_CONTENT = f"""
     <h1>Наши филиалы</h1>
     <p style="margin-bottom: 2rem;">Мы представлены в нескольких странах мира, чтобы быть ближе к нашим клиентам</p>
     
     <div class="grid">
-        <div class="card branch-card">
-            <img src="https://images.unsplash.com/photo-1513635269975-59663e0ac1ad?ixlib=rb-4.0.3&auto=format&fit=crop&w=1350&q=80" alt="Лондон" class="branch-image">
-            <div class="branch-overlay">
-                <h3>Лондон</h3>
-                <p>Наш первый международный филиал</p>
-                <a href="/branches/London" class="btn" style="padding: 0.5rem 1rem; font-size: 0.9rem; margin-top: 0.5rem;">Подробнее</a>
-            </div>
-        </div>
-        
-        <div class="card branch-card">
-            <img src="https://images.unsplash.com/photo-1431274172761-fca41d930114?ixlib=rb-4.0.3&auto=format&fit=crop&w=1350&q=80" alt="Париж" class="branch-image">
-            <div class="branch-overlay">
-                <h3>Париж</h3>
-                <p>Европейский центр инноваций</p>
-                <a href="/branches/Paris" class="btn" style="padding: 0.5rem 1rem; font-size: 0.9rem; margin-top: 0.5rem;">Подробнее</a>
-            </div>
-        </div>
-        
-        <div class="card branch-card">
-            <img src="https://images.unsplash.com/photo-1587330979470-3595ac045ab0?ixlib=rb-4.0.3&auto=format&fit=crop&w=1350&q=80" alt="Берлин" class="branch-image">
-            <div class="branch-overlay">
-                <h3>Берлин</h3>
-                <p>Современный технологический хаб</p>
-                <a href="/branches/Berlin" class="btn" style="padding: 0.5rem 1rem; font-size: 0.9rem; margin-top: 0.5rem;">Подробнее</a>
-            </div>
-        </div>
+{BRANCH_CARDS}
     </div>
     
     <div class="quick-links">
@@ -679,106 +610,20 @@ async def branches_list():
             <li><a href="/contacts">Контактная информация</a></li>
         </ul>
     </div>
-    """
-    return HTMLResponse(content=get_base_html("Филиалы", content))
+"""
+
+@app.get("/branches", response_class=HTMLResponse)
+async def branches_list(request: Request):
+    return await page_cache.response(request, "branches", "Филиалы", BRANCHES_LIST_CONTENT)
 
 @app.get("/branches/{city}", response_class=HTMLResponse)
-async def branch_detail(city: str):
-    branches = {
-        "London": {
-            "title": "Лондонский филиал",
-            "address": "123 Business Street, London, UK",
-            "phone": "+44 20 7946 0958",
-            "email": "london@company.com",
-            "description": "Наш первый международный филиал, открытый в 2015 году. Лондонский офис специализируется на финансовых технологиях и обслуживании клиентов из Европы и Ближнего Востока.",
-            "image": "https://images.unsplash.com/photo-1513635269975-59663e0ac1ad?ixlib=rb-4.0.3&auto=format&fit=crop&w=1350&q=80",
-            "manager": "Джон Смит",
-            "employees": "45 сотрудников",
-            "services": "Финансовые технологии, Консалтинг, Поддержка клиентов"
-        },
-        "Paris": {
-            "title": "Парижский филиал",
-            "address": "456 Rue de Commerce, Paris, France",
-            "phone": "+33 1 23 45 67 89",
-            "email": "paris@company.com",
-            "description": "Европейский центр инноваций, открыт в 2018 году. Парижская команда сосредоточена на разработке новых продуктов и искусственном интеллекте.",
-            "image": "https://images.unsplash.com/photo-1431274172761-fca41d930114?ixlib=rb-4.0.3&auto=format&fit=crop&w=1350&q=80",
-            "manager": "Мари Дюпон",
-            "employees": "32 сотрудника",
-            "services": "Исследования и разработки, Искусственный интеллект, Продуктовая разработка"
-        },
-        "Berlin": {
-            "title": "Берлинский филиал",
-            "address": "789 Geschäftsstraße, Berlin, Germany",
-            "phone": "+49 30 901820",
-            "email": "berlin@company.com",
-            "description": "Современный технологический хаб, открыт в 2020 году. Берлинский офис является центром разработки облачных решений и кибербезопасности.",
-            "image": "https://images.unsplash.com/photo-1587330979470-3595ac045ab0?ixlib=rb-4.0.3&auto=format&fit=crop&w=1350&q=80",
-            "manager": "Томас Мюллер",
-            "employees": "28 сотрудников",
-            "services": "Облачные решения, Кибербезопасность, Техническая поддержка"
-        }
-    }
-    
-    if city in branches:
-        branch = branches[city]
-        content = f"""
-        <div class="card" style="position: relative; overflow: hidden; padding: 0;">
-            <img src="{branch['image']}" alt="{branch['title']}" style="width: 100%; height: 400px; object-fit: cover;">
-            <div style="position: absolute; bottom: 0; left: 0; right: 0; background: linear-gradient(transparent, rgba(0, 0, 0, 0.8)); padding: 2rem; color: white;">
-                <h1 style="color: white;">{branch['title']}</h1>
-            </div>
-        </div>
-        
-        <div class="grid" style="margin-top: 2rem; grid-template-columns: 1fr 1fr;">
-            <div class="card">
-                <h2>Контактная информация</h2>
-                <p><strong>Адрес:</strong> {branch['address']}</p>
-                <p><strong>Телефон:</strong> {branch['phone']}</p>
-                <p><strong>Email:</strong> {branch['email']}</p>
-                <p><strong>Менеджер филиала:</strong> {branch['manager']}</p>
-                <p><strong>Количество сотрудников:</strong> {branch['employees']}</p>
-                <a href="/contacts" class="btn" style="padding: 0.5rem 1rem; font-size: 0.9rem; margin-top: 1rem;">Связаться с нами</a>
-            </div>
-            
-            <div class="card">
-                <h2>О филиале</h2>
-                <p>{branch['description']}</p>
-                <h3 style="margin-top: 1.5rem;">Основные направления</h3>
-                <p>{branch['services']}</p>
-                <a href="/branches" class="btn btn-secondary" style="padding: 0.5rem 1rem; font-size: 0.9rem; margin-top: 1rem;">Все филиалы</a>
-            </div>
-        </div>
-        
-        <div class="quick-links">
-            <h3>Другие филиалы</h3>
-            <ul>
-                <li><a href="/branches/London">Лондон</a></li>
-                                <li><a href="/branches/Paris">Париж</a></li>
-                <li><a href="/branches/Berlin">Берлин</a></li>
-            </ul>
-        </div>
-        
-        <div class="card">
-            <h2>Форма для связи с филиалом</h2>
-            <form style="display: grid; gap: 1rem; margin-top: 1rem;">
-                <div>
-                    <label for="name" style="display: block; margin-bottom: 0.5rem; font-weight: 500;">Ваше имя</label>
-                    <input type="text" id="name" style="width: 100%; padding: 0.7rem; border: 1px solid var(--gray); border-radius: 0.5rem;">
-                </div>
-                <div>
-                    <label for="email" style="display: block; margin-bottom: 0.5rem; font-weight: 500;">Email</label>
-                    <input type="email" id="email" style="width: 100%; padding: 0.7rem; border: 1px solid var(--gray); border-radius: 0.5rem;">
-                </div>
-                <div>
-                    <label for="message" style="display: block; margin-bottom: 0.5rem; font-weight: 500;">Сообщение</label>
-                    <textarea id="message" rows="4" style="width: 100%; padding: 0.7rem; border: 1px solid var(--gray); border-radius: 0.5rem;"></textarea>
-                </div>
-                <button type="submit" class="btn">Отправить</button>
-            </form>
-        </div>
-        """
-        return HTMLResponse(content=get_base_html(branch['title'], content))
+async def branch_detail(request: Request, city: str):
+    branch = branches.get(city)
+    if branch is not None:
+        city = branch["city"]
+        if was_sent(request):
+            return await page_cache.response(request, f"branch:{city}:sent", branch["title"], BRANCH_SENT_PAGES[city])
+        return await page_cache.response(request, f"branch:{city}", branch["title"], BRANCH_PAGES[city])
     else:
         content = """
         <div class="card" style="text-align: center; padding: 3rem;">
@@ -787,20 +632,269 @@ async def branch_detail(city: str):
             <a href="/branches" class="btn">Все наши филиалы</a>
         </div>
         """
-        return HTMLResponse(content=get_base_html("Филиал не найден", content))
+        return await page_cache.response(request, "branch-not-found", "Филиал не найден", content, status_code=404)
 
 
-@app.get("/api/random")
-async def random_number():
-    return {"number": random.randint(1, 100)}
+FORM_FIELDS = {"name": "Ваше имя", "email": "Email", "message": "Сообщение"}
+
+def form_error(page: str, problems: list, status_code: int, headers: dict | None = None) -> Response:
+    """The HTML answer to a form post that could not be accepted, with a way back to the form."""
+    items = "".join(f"<li>{escape(problem)}</li>" for problem in problems)
+    content = f"""
+    <div class="card">
+        <h2>Сообщение не отправлено</h2>
+        <ul style="margin: 1rem 0 2rem 1.5rem;">{items}</ul>
+        <a href="{escape(page)}" class="btn">Вернуться к форме</a>
+    </div>
+    """
+    return Response(
+        render_uncached("Сообщение не отправлено", content),
+        status_code=status_code,
+        headers={"cache-control": "no-store", **(headers or {})},
+        media_type="text/html; charset=utf-8",
+    )
 
-@app.get("/api/user-agent")
+async def accept_contact(request: Request, page: str, branch: str | None = None):
+    body = await request.body()
+    is_form = request.headers.get("content-type", "").startswith("application/x-www-form-urlencoded")
+    try:
+        data = dict(parse_qsl(body.decode("utf-8"))) if is_form else json.loads(body)
+    except ValueError:
+        if is_form:
+            return form_error(page, ["Не удалось прочитать форму, попробуйте ещё раз."], 422)
+        raise RequestValidationError([{"type": "value_error", "loc": ("body",), "msg": "Malformed request body", "input": None}])
+    try:
+        submission = ContactSubmission.model_validate(data)
+    except ValueError as exc:
+        errors = exc.errors(include_url=False)
+        if is_form:
+            fields = dict.fromkeys(FORM_FIELDS.get(error["loc"][-1] if error["loc"] else None, "Форма") for error in errors)
+            return form_error(page, [f"{field}: заполните поле правильно." for field in fields], 422)
+        raise RequestValidationError(errors)
+    if not contact_writer.submit(submission, branch):
+        if is_form:
+            return form_error(page, ["Слишком много обращений, попробуйте позже."], 503, {"retry-after": "5"})
+        return FastJSONResponse(
+            {"detail": "Слишком много обращений, попробуйте позже"},
+            status_code=503,
+            headers={"retry-after": "5"},
+        )
+    if is_form:
+        return Response(status_code=303, headers={"location": f"{page}?sent=1"})
+    return FastJSONResponse({"status": "queued"}, status_code=202)
+
+@app.post("/contacts", status_code=202)
+async def submit_contact(request: Request):
+    return await accept_contact(request, "/contacts")
+
+@app.post("/branches/{city}/contact", status_code=202)
+async def submit_branch_contact(request: Request, city: str):
+    branch = branches.get(city)
+    if branch is None:
+        raise HTTPException(status_code=404)
+    return await accept_contact(request, f"/branches/{branch['city']}", branch["city"])
+
+@app.get("/api/random", response_model=RandomNumber | RandomNumbers)
+async def random_number(
+    request: Request,
+    count: int | None = Query(None, ge=1, le=random_numbers.MAX_COUNT),
+    low: int = Query(1, alias="min", ge=random_numbers.INT64_MIN, le=random_numbers.INT64_MAX),
+    high: int = Query(100, alias="max", ge=random_numbers.INT64_MIN, le=random_numbers.INT64_MAX),
+    seed: int | None = Query(None, ge=0, le=random_numbers.INT64_MAX),
+    offset: int = Query(0, ge=0, le=random_numbers.MAX_OFFSET),
+    distribution: Literal["uniform", "normal"] = "uniform",
+    format: Literal["json", "binary", "msgpack"] | None = None,
+):
+    if low > high:
+        raise HTTPException(status_code=422, detail="min must not be greater than max")
+    if count is None and seed is None and format is None:
+        if distribution == "uniform":
+            number = random.randint(low, high)
+        else:
+            number = random_numbers.to_list(random_numbers.generate(1, low, high, distribution))[0]
+        return negotiated(request, {"number": number})
+
+    values = random_numbers.generate(count or 1, low, high, distribution, seed, offset)
+    if format is None:
+        accept = request.headers.get("accept", "")
+        if MSGPACK in accept:
+            format = "msgpack"
+        elif "application/octet-stream" in accept:
+            format = "binary"
+    # The format may come from Accept, so shared caches must key on it like negotiated() does.
+    headers = {"x-count": str(len(values)), "vary": "Accept"}
+    if seed is not None:
+        headers["x-next-offset"] = str(offset + len(values))
+    if format == "binary":
+        headers["x-dtype"] = "<i8"
+        return Response(random_numbers.to_le_bytes(values), media_type="application/octet-stream", headers=headers)
+    # The array goes into the payload as is; both encoders take it without a list copy.
+    payload = {"numbers": values}
+    if seed is not None:
+        payload.update(seed=seed, offset=offset, next_offset=offset + len(values))
+    if format == "msgpack":
+        if json_responses.msgpack is None:
+            raise HTTPException(status_code=406, detail="msgpack is not available on this server")
+        return MsgpackResponse(payload, headers=headers)
+    return FastJSONResponse(payload, headers=headers)
+
+STREAM_FORMATS = {
+    "ndjson": ("application/x-ndjson", lambda numbers: b'{"numbers":' + json_responses.dumps(numbers) + b"}\n"),
+    "sse": ("text/event-stream", lambda numbers: b'data: {"numbers":' + json_responses.dumps(numbers) + b"}\n\n"),
+}
+
+async def random_frames(subscription, encode, limit: int | None):
+    sent = 0
+    try:
+        async for numbers in subscription.frames():
+            if limit is not None:
+                numbers = numbers[:limit - sent]
+            sent += len(numbers)
+            yield encode(numbers)
+            if limit is not None and sent >= limit:
+                break
+    finally:
+        random_ticker.unsubscribe(subscription)
+
+@app.get("/api/random/stream")
+async def random_stream(
+    request: Request,
+    rate: float = Query(10, gt=0),
+    batch: int | None = Query(None, ge=1),
+    limit: int | None = Query(None, ge=1),
+    low: int = Query(1, alias="min", ge=random_numbers.INT64_MIN, le=random_numbers.INT64_MAX),
+    high: int = Query(100, alias="max", ge=random_numbers.INT64_MIN, le=random_numbers.INT64_MAX),
+    format: Literal["ndjson", "sse"] | None = None,
+):
+    if low > high:
+        raise HTTPException(status_code=422, detail="min must not be greater than max")
+    if format is None:
+        format = "sse" if "text/event-stream" in request.headers.get("accept", "") else "ndjson"
+    try:
+        subscription = random_ticker.subscribe(rate, low, high, batch)
+    except StreamUnavailable as exc:
+        return FastJSONResponse({"detail": str(exc)}, status_code=503, headers={"retry-after": "5"})
+    media_type, encode = STREAM_FORMATS[format]
+    return StreamingResponse(
+        random_frames(subscription, encode, limit),
+        media_type=media_type,
+        headers={"cache-control": "no-store", "x-rate": str(subscription.rate), "x-accel-buffering": "no"},
+    )
+
+@app.websocket("/api/random/ws")
+async def random_websocket(
+    websocket: WebSocket,
+    rate: float = Query(10, gt=0),
+    batch: int | None = Query(None, ge=1),
+    low: int = Query(1, alias="min", ge=random_numbers.INT64_MIN, le=random_numbers.INT64_MAX),
+    high: int = Query(100, alias="max", ge=random_numbers.INT64_MIN, le=random_numbers.INT64_MAX),
+):
+    if low > high:
+        await websocket.close(code=1008, reason="min must not be greater than max")
+        return
+    try:
+        subscription = random_ticker.subscribe(rate, low, high, batch)
+    except StreamUnavailable as exc:
+        await websocket.close(code=1013, reason=str(exc))
+        return
+    try:
+        await websocket.accept()
+        async for numbers in subscription.frames():
+            await websocket.send_text('{"numbers":' + json_responses.dumps(numbers).decode("utf-8") + "}")
+        # The feed only ends when the worker is shutting down.
+        await websocket.close(code=1001)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        random_ticker.unsubscribe(subscription)
+
+def render_search(query: str, results: list, total: int) -> str:
+    items = "".join(
+        f"""
+        <div class="card">
+            <h2><a href="{escape(document.url)}" style="color: inherit; text-decoration: none;">{escape(document.title)}</a></h2>
+            <p>{escape(search_index.snippet(document, query))}</p>
+        </div>
+        """
+        for _, document in results
+    )
+    if query and not results:
+        items = """
+        <div class="card"><p>Ничего не найдено.</p></div>
+        """
+    summary = f'<p style="margin-bottom: 2rem;">Найдено страниц: {total}</p>' if query else ""
+    return f"""
+    <h1>Поиск по сайту</h1>
+    <form method="get" action="/search" style="display: flex; gap: 1rem; margin: 1rem 0 2rem;">
+        <input type="search" name="q" value="{escape(query)}" maxlength="200" autofocus style="flex: 1; padding: 0.7rem; border: 1px solid var(--gray); border-radius: 0.5rem;">
+        <button type="submit" class="btn">Найти</button>
+    </form>
+    {summary}
+    {items}
+    """
+
+@app.get("/search", response_class=HTMLResponse)
+async def search_page(q: str = Query("", max_length=200)):
+    total, results = search_index.search(q) if q.strip() else (0, [])
+    body = render_uncached("Поиск", render_search(q.strip(), results, total))
+    return Response(body, media_type="text/html; charset=utf-8", headers={"cache-control": "no-cache"})
+
+@app.get("/api/search", response_model=SearchResults)
+async def api_search(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(10, ge=1, le=50),
+):
+    total, results = search_index.search(q, limit)
+    return negotiated(request, {
+        "query": q,
+        "total": total,
+        "results": [
+            {"url": document.url, "title": document.title, "snippet": search_index.snippet(document, q), "score": round(score, 4)}
+            for score, document in results
+        ],
+    })
+
+@app.get("/api/user-agent", response_model=UserAgentInfo)
 async def read_user_agent(request: Request):
     user_agent = request.headers.get("user-agent")
-    return {"user_agent": user_agent}
-@app.exception_handler(404)
-async def not_found_exception_handler(request: Request, exc):
-    content = """
+    return negotiated(request, {**user_agents.parse(user_agent)._asdict(), "user_agent": user_agent})
+
+@app.post("/api/user-agent", response_model=UserAgentResults)
+async def analyze_user_agents(request: Request, batch: UserAgentBatch):
+    return negotiated(request, {"results": [user_agents.parse(user_agent)._asdict() for user_agent in batch.user_agents]})
+
+@app.get("/assets/{name}")
+async def asset(request: Request, name: str):
+    static_asset = assets.get(name)
+    if static_asset is None:
+        raise HTTPException(status_code=404)
+    return static_asset.response(request)
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/api/cache-stats")
+async def cache_stats():
+    return page_cache.stats()
+
+CATCH_ALL_REDIRECTS = {
+    section: {"location": f"/{section}", "cache-control": "public, max-age=86400"}
+    for section in ("management", "about", "contacts")
+}
+
+@app.get("/management/{path:path}")
+@app.get("/about/{path:path}")
+@app.get("/contacts/{path:path}")
+async def catch_all_redirect(request: Request, path: str):
+    # Old and mistyped links under a section all collapse onto the section page,
+    # so they share its cache entry instead of each rendering a page of their own.
+    section = request.scope["path"].split("/", 2)[1]
+    return Response(status_code=301, headers=CATCH_ALL_REDIRECTS[section])
+
+NOT_FOUND_TITLE = "Страница не найдена"
+NOT_FOUND_CONTENT = """
     <div class="hero" style="text-align: center;">
         <h1 style="color: white;">404 - Страница не найдена</h1>
         <p style="font-size: 1.2rem; margin: 1rem 0 2rem;">Запрошенная вами страница не существует или была перемещена.</p>
@@ -817,7 +911,26 @@ async def not_found_exception_handler(request: Request, exc):
         </ul>
     </div>
     """
-    return HTMLResponse(content=get_base_html("Страница не найдена", content))
+page_cache.get("not-found", NOT_FOUND_TITLE, NOT_FOUND_CONTENT)
+
+# NOT_FOUND_RATE=0 turns the 404 flood limit off.
+NOT_FOUND_RATE = float(os.environ.get("NOT_FOUND_RATE", "5"))
+not_found_limiter = None
+if NOT_FOUND_RATE > 0:
+    not_found_limiter = TokenBuckets(rate=NOT_FOUND_RATE, burst=float(os.environ.get("NOT_FOUND_BURST", "50")))
+
+@app.exception_handler(404)
+async def not_found_exception_handler(request: Request, exc):
+    if not_found_limiter is not None:
+        client = request.client.host if request.client else None
+        retry_after = not_found_limiter.take(client)
+        if retry_after:
+            start, body = rejection(429, "Too Many Requests", retry_after)
+            headers = {name.decode("latin-1"): value.decode("latin-1") for name, value in start["headers"]}
+            return Response(body["body"], status_code=start["status"], headers=headers)
+    return await page_cache.response(request, "not-found", NOT_FOUND_TITLE, NOT_FOUND_CONTENT, status_code=404)
 
 
-uvicorn.run(app)
\ No newline at end of file
+if __name__ == "__main__":
+    import server
+    server.main()
@@ -0,0 +1,211 @@
+"""Self-hosted copies of the web fonts and the third-party images the pages use.
+
+    python media.py sync
+
+downloads the Google Fonts stylesheet and its font files into static/fonts,
+and every image registered through MediaLibrary.img_attrs or css_urls (the
+stylesheet's backgrounds) into static/media, where Pillow (optional) turns
+each one into resized WebP variants once.
+static/media is a disk cache bounded by MEDIA_CACHE_BYTES; the least
+recently used files go first. Until a file has been synced, or after it was
+evicted, the templates keep pointing at the original remote URL.
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import re
+import sys
+import urllib.request
+from html import escape
+from pathlib import Path
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+GOOGLE_FONTS_URL = (
+    "https://fonts.googleapis.com/css2?family=Montserrat:wght@400;600;700"
+    "&family=Roboto:wght@300;400;500&display=swap"
+)
+GOOGLE_FONT_LINKS = f"""<link rel="preconnect" href="https://fonts.googleapis.com">
+        <link rel="preconnect" href="https://fonts.gstatic.com" crossorigin>
+        <link href="{escape(GOOGLE_FONTS_URL)}" rel="stylesheet">"""
+# Google only serves woff2 to browsers it recognises.
+USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0 Safari/537.36"
+WIDTHS = (480, 960, 1350)
+INDEX_NAME = "index.json"
+
+_FONT_URL = re.compile(r"url\((https://fonts\.gstatic\.com/[^)]+)\)")
+_CSS_IMAGE = re.compile(r"""url\((['"]?)(https?://[^)'"]+)\1\)""")
+
+
+def fetch(url: str) -> bytes:
+    request = urllib.request.Request(url, headers={"user-agent": USER_AGENT})
+    with urllib.request.urlopen(request, timeout=30) as response:
+        return response.read()
+
+
+class DiskLRU:
+    """Files in one directory, capped at max_bytes; reading a file marks it as recently used."""
+
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+
+    def get(self, name: str) -> Path | None:
+        path = self.root / name
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, name: str, data: bytes) -> Path:
+        self.root.mkdir(parents=True, exist_ok=True)
+        path = self.root / name
+        path.write_bytes(data)
+        self.evict()
+        return path
+
+    def evict(self):
+        files = [path for path in self.root.iterdir() if path.is_file() and path.name != INDEX_NAME]
+        total = sum(path.stat().st_size for path in files)
+        for path in sorted(files, key=lambda path: path.stat().st_mtime):
+            if total <= self.max_bytes:
+                break
+            total -= path.stat().st_size
+            path.unlink()
+
+
+class MediaLibrary:
+    def __init__(self, root: Path, url_prefix: str, max_bytes: int | None = None):
+        if max_bytes is None:
+            max_bytes = int(os.environ.get("MEDIA_CACHE_BYTES", str(256 * 1024 * 1024)))
+        self.root = root
+        self.url_prefix = url_prefix
+        self.cache = DiskLRU(root, max_bytes)
+        self.sources = []
+        try:
+            self.index = json.loads((root / INDEX_NAME).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            self.index = {}
+
+    def _local(self, url: str) -> dict | None:
+        entry = self.index.get(url)
+        if entry is None:
+            return None
+        names = [entry["src"], *(name for name, _ in entry["srcset"])]
+        if any(self.cache.get(name) is None for name in names):
+            return None
+        return entry
+
+    def img_attrs(self, url: str, sizes: str = "100vw") -> str:
+        """src/srcset/sizes attributes for an <img>, local when synced and remote otherwise."""
+        if url not in self.sources:
+            self.sources.append(url)
+        entry = self._local(url)
+        if entry is None:
+            return f'src="{escape(url)}"'
+        attrs = f'src="{self.url_prefix}/{entry["src"]}"'
+        if entry["srcset"]:
+            srcset = ", ".join(f"{self.url_prefix}/{name} {width}w" for name, width in entry["srcset"])
+            attrs += f' srcset="{srcset}" sizes="{escape(sizes)}"'
+        return attrs
+
+    def css_urls(self, css: str) -> str:
+        """Register the remote images a stylesheet uses and point it at the largest local copy of each synced one."""
+
+        def localize(match):
+            url = match.group(2)
+            if url not in self.sources:
+                self.sources.append(url)
+            entry = self._local(url)
+            if entry is None:
+                return match.group(0)
+            name = entry["srcset"][-1][0] if entry["srcset"] else entry["src"]
+            return f"url({self.url_prefix}/{name})"
+
+        return _CSS_IMAGE.sub(localize, css)
+
+    def sync_image(self, url: str):
+        key = hashlib.sha1(url.encode("utf-8")).hexdigest()[:16]
+        data = fetch(url)
+        suffix = ".png" if data[:8] == b"\x89PNG\r\n\x1a\n" else ".jpg"
+        self.cache.put(key + suffix, data)
+        entry = {"src": key + suffix, "srcset": []}
+        if Image is not None:
+            with Image.open(io.BytesIO(data)) as image:
+                image = image.convert("RGB")
+                for width in WIDTHS:
+                    if width > image.width:
+                        break
+                    height = round(image.height * width / image.width)
+                    buffer = io.BytesIO()
+                    image.resize((width, height), Image.LANCZOS).save(buffer, "WEBP", quality=80, method=6)
+                    name = f"{key}-{width}.webp"
+                    self.cache.put(name, buffer.getvalue())
+                    entry["srcset"].append([name, width])
+        self.index[url] = entry
+
+    def save_index(self):
+        self.root.mkdir(parents=True, exist_ok=True)
+        (self.root / INDEX_NAME).write_text(json.dumps(self.index, indent=2), encoding="utf-8")
+
+
+def sync_fonts(css_path: Path, fonts_dir: Path, url_prefix: str):
+    css = fetch(GOOGLE_FONTS_URL).decode("utf-8")
+    fonts_dir.mkdir(parents=True, exist_ok=True)
+
+    def localize(match):
+        url = match.group(1)
+        name = url.rsplit("/", 1)[-1]
+        path = fonts_dir / name
+        if not path.exists():
+            path.write_bytes(fetch(url))
+        return f"url({url_prefix}/{name})"
+
+    css_path.write_text(_FONT_URL.sub(localize, css), encoding="utf-8")
+
+
+def font_links(assets, css_path: Path) -> str:
+    """The <head> links for the web fonts: the vendored stylesheet if synced, Google otherwise."""
+    if not css_path.exists():
+        return GOOGLE_FONT_LINKS
+    return f'<link rel="stylesheet" href="{assets.add(css_path).url}">'
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Download fonts and images for local serving.")
+    parser.add_argument("command", choices=["sync"])
+    parser.add_argument("--skip-fonts", action="store_true")
+    args = parser.parse_args(argv)
+
+    import main
+
+    failed = 0
+    if not args.skip_fonts:
+        try:
+            sync_fonts(main.FONTS_CSS_PATH, main.STATIC_DIR / "fonts", "/static/fonts")
+            print(f"fonts: {main.FONTS_CSS_PATH}")
+        except OSError as exc:
+            failed += 1
+            print(f"fonts: {exc}", file=sys.stderr)
+    for url in main.media.sources:
+        try:
+            main.media.sync_image(url)
+            print(f"image: {url}")
+        except OSError as exc:
+            failed += 1
+            print(f"image: {url}: {exc}", file=sys.stderr)
+    main.media.save_index()
+    if Image is None:
+        print("Pillow is not installed: images were stored as is, without resized variants", file=sys.stderr)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,272 @@
+"""Per-route request metrics in Prometheus text format.
+
+Every worker keeps its numbers in plain dicts and lists owned by its event
+loop, so recording a request needs no locks. When METRICS_DIR is set (one
+directory shared by all workers of a deployment), a background task of each
+worker also dumps a snapshot there about once a second, writing it from a
+thread, and /metrics merges every live worker's snapshot, the same way
+prometheus_client's multiprocess mode does. A worker removes its file when
+it stops; files left behind by workers that died are skipped and removed.
+
+METRICS=0 leaves the middleware out, so its cost can be measured with
+bench.py by comparing a run with and without it.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from bisect import bisect_left
+from pathlib import Path
+
+from inprocess import INTERNAL
+
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+SIZE_BUCKETS = (128, 512, 1024, 2048, 4096, 8192, 16384, 32768, 65536, 262144, 1048576)
+UNMATCHED = "<unmatched>"
+
+
+class RouteStats:
+    __slots__ = ("requests", "duration", "duration_sum", "size", "size_sum")
+
+    def __init__(self):
+        self.requests = {}
+        # One slot per bucket plus +Inf; stored non-cumulative, summed on export.
+        self.duration = [0] * (len(DURATION_BUCKETS) + 1)
+        self.duration_sum = 0.0
+        self.size = [0] * (len(SIZE_BUCKETS) + 1)
+        self.size_sum = 0
+
+    def snapshot(self) -> dict:
+        return {
+            "requests": {f"{method} {status}": count for (method, status), count in self.requests.items()},
+            # Copies, so the writer thread never sees a list the event loop is still updating.
+            "duration": list(self.duration),
+            "duration_sum": self.duration_sum,
+            "size": list(self.size),
+            "size_sum": self.size_sum,
+        }
+
+
+class MetricsRegistry:
+    def __init__(self, directory: str | None = None, flush_interval: float = 1.0):
+        self.routes = {}
+        self.in_flight = 0
+        self.collectors = []
+        self.directory = Path(directory) if directory else None
+        self.flush_interval = flush_interval
+        self.pid = os.getpid()
+        self._task = None
+        self._stopping = asyncio.Event()
+
+    def observe(self, route: str, method: str, status: int, duration: float, size: int):
+        stats = self.routes.get(route)
+        if stats is None:
+            stats = self.routes[route] = RouteStats()
+        key = (method, status)
+        stats.requests[key] = stats.requests.get(key, 0) + 1
+        stats.duration[bisect_left(DURATION_BUCKETS, duration)] += 1
+        stats.duration_sum += duration
+        stats.size[bisect_left(SIZE_BUCKETS, size)] += 1
+        stats.size_sum += size
+
+    def add_collector(self, collect):
+        """Register a callable returning [(name, type, help, value), ...] sampled on every scrape."""
+        self.collectors.append(collect)
+
+    def snapshot(self) -> dict:
+        return {
+            "pid": self.pid,
+            "in_flight": self.in_flight,
+            "routes": {route: stats.snapshot() for route, stats in self.routes.items()},
+            "samples": [sample for collect in self.collectors for sample in collect()],
+        }
+
+    async def start(self):
+        if self.directory is None:
+            return
+        # Resolved here, not at import, so every worker process gets its own file.
+        self.pid = os.getpid()
+        self._stopping.clear()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._stopping.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+            await asyncio.to_thread(self._remove)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.flush_interval)
+                return
+            except asyncio.TimeoutError:
+                pass
+            # The snapshot is taken on the event loop, which owns the numbers; only the write happens in the thread.
+            try:
+                await asyncio.to_thread(self._write, self.snapshot())
+            except Exception:
+                logger.exception("Failed to write the metrics snapshot")
+
+    def _path(self, pid: int) -> Path:
+        return self.directory / f"worker-{pid}.json"
+
+    def _write(self, snapshot: dict):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        target = self._path(self.pid)
+        temporary = target.with_suffix(".tmp")
+        temporary.write_text(json.dumps(snapshot), encoding="utf-8")
+        os.replace(temporary, target)
+
+    def _remove(self):
+        try:
+            self._path(self.pid).unlink()
+        except FileNotFoundError:
+            pass
+
+    def collect(self) -> list:
+        # This worker's numbers come straight from memory; the files are for the other workers.
+        snapshots = [self.snapshot()]
+        if self.directory is None:
+            return snapshots
+        for path in self.directory.glob("worker-*.json"):
+            try:
+                snapshot = json.loads(path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                continue
+            if snapshot["pid"] == self.pid:
+                continue
+            if not _alive(snapshot["pid"]):
+                # Left behind by a worker that died without stopping; its numbers would otherwise count forever.
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+                continue
+            snapshots.append(snapshot)
+        return snapshots
+
+    def render(self) -> str:
+        return render_prometheus(merge(self.collect()))
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def merge(snapshots: list) -> dict:
+    merged = {"in_flight": 0, "routes": {}, "samples": {}}
+    for snapshot in snapshots:
+        merged["in_flight"] += snapshot["in_flight"]
+        for route, stats in snapshot["routes"].items():
+            target = merged["routes"].get(route)
+            if target is None:
+                merged["routes"][route] = {
+                    "requests": dict(stats["requests"]),
+                    "duration": list(stats["duration"]),
+                    "duration_sum": stats["duration_sum"],
+                    "size": list(stats["size"]),
+                    "size_sum": stats["size_sum"],
+                }
+                continue
+            for key, count in stats["requests"].items():
+                target["requests"][key] = target["requests"].get(key, 0) + count
+            target["duration"] = [a + b for a, b in zip(target["duration"], stats["duration"])]
+            target["duration_sum"] += stats["duration_sum"]
+            target["size"] = [a + b for a, b in zip(target["size"], stats["size"])]
+            target["size_sum"] += stats["size_sum"]
+        for name, kind, help_text, value in snapshot["samples"]:
+            previous = merged["samples"].get(name)
+            merged["samples"][name] = (kind, help_text, value + (previous[2] if previous else 0))
+    return merged
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _histogram(lines: list, name: str, labels: str, buckets: tuple, counts: list, total):
+    cumulative = 0
+    for bound, count in zip(buckets, counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+    cumulative += counts[-1]
+    lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {cumulative}')
+    lines.append(f"{name}_sum{{{labels}}} {total}")
+    lines.append(f"{name}_count{{{labels}}} {cumulative}")
+
+
+def render_prometheus(merged: dict) -> str:
+    routes = sorted(merged["routes"].items())
+    lines = [
+        "# HELP http_requests_total Requests handled, by route template, method and status.",
+        "# TYPE http_requests_total counter",
+    ]
+    for route, stats in routes:
+        for key, count in sorted(stats["requests"].items()):
+            method, status = key.split(" ")
+            lines.append(f'http_requests_total{{route="{_escape(route)}",method="{method}",status="{status}"}} {count}')
+    lines += [
+        "# HELP http_requests_in_flight Requests currently being handled.",
+        "# TYPE http_requests_in_flight gauge",
+        f"http_requests_in_flight {merged['in_flight']}",
+        "# HELP http_request_duration_seconds Time spent handling a request, by route template.",
+        "# TYPE http_request_duration_seconds histogram",
+    ]
+    for route, stats in routes:
+        labels = f'route="{_escape(route)}"'
+        _histogram(lines, "http_request_duration_seconds", labels, DURATION_BUCKETS, stats["duration"], stats["duration_sum"])
+    lines += [
+        "# HELP http_response_size_bytes Response body size, by route template.",
+        "# TYPE http_response_size_bytes histogram",
+    ]
+    for route, stats in routes:
+        labels = f'route="{_escape(route)}"'
+        _histogram(lines, "http_response_size_bytes", labels, SIZE_BUCKETS, stats["size"], stats["size_sum"])
+    for name, (kind, help_text, value) in sorted(merged["samples"].items()):
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}", f"{name} {value}"]
+    return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    def __init__(self, app, registry: MetricsRegistry):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get(INTERNAL):
+            await self.app(scope, receive, send)
+            return
+
+        registry = self.registry
+        status = 500
+        size = 0
+
+        async def send_wrapper(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        registry.in_flight += 1
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = time.perf_counter() - start
+            registry.in_flight -= 1
+            route = scope.get("route")
+            registry.observe(route.path if route is not None else UNMATCHED, scope["method"], status, duration, size)
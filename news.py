@@ -0,0 +1,353 @@
+"""News articles loaded from a directory of Markdown files.
+
+Each data/news/*.md file is one article: a front matter block with title,
+date (YYYY-MM-DD) and optionally summary and slug, then a Markdown body.
+The body goes through the `markdown` package when it is installed, and
+through a small built-in subset (headings, lists, links, bold, italics)
+otherwise.
+
+NewsStore keeps a date-sorted index and caches everything derived from an
+article: its page, its card on the list pages and its Atom entry. Those are
+built once, when the file is loaded. List pages and the feed are joined
+from the cached fragments, and `apply` only throws away the list pages and
+the feed that a changed file can show up in. Rendering a whole page from an
+unchanged fragment is then left to PageCache, which sees the same content
+string and keeps its copy.
+"""
+import asyncio
+import bisect
+import logging
+import re
+import sys
+from datetime import date, datetime, timezone
+from html import escape
+from pathlib import Path
+
+try:
+    import markdown
+except ImportError:
+    markdown = None
+
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 10
+FEED_SIZE = 50
+
+_FRONT_MATTER = re.compile(r"\A---\s*\n(.*?)\n---\s*\n", re.DOTALL)
+_INLINE = [
+    (re.compile(r"\[([^\]]+)\]\(([^)\s]+)\)"), r'<a href="\2">\1</a>'),
+    (re.compile(r"\*\*(.+?)\*\*"), r"<strong>\1</strong>"),
+    (re.compile(r"\*(.+?)\*"), r"<em>\1</em>"),
+]
+_MARKUP = re.compile(r"\[([^\]]+)\]\([^)]*\)|[*_`#]")
+
+ARTICLE_TEMPLATE = """
+    <article class="card">
+        <h1>{title}</h1>
+        <p style="color: var(--gray); margin-bottom: 1.5rem;">{date}</p>
+        {body}
+    </article>
+    <a href="/news" class="btn btn-secondary" style="padding: 0.5rem 1rem; font-size: 0.9rem;">Все новости</a>
+    """
+
+CARD_TEMPLATE = """
+    <div class="card">
+        <h2><a href="/news/{slug}" style="color: inherit; text-decoration: none;">{title}</a></h2>
+        <p style="color: var(--gray); margin-bottom: 1.5rem;">{date}</p>
+        <p>{summary}</p>
+        <a href="/news/{slug}" class="btn" style="padding: 0.5rem 1rem; font-size: 0.9rem; margin-top: 1rem;">Читать полностью</a>
+    </div>
+    """
+
+ENTRY_TEMPLATE = """  <entry>
+    <id>{url}</id>
+    <title>{title}</title>
+    <link href="{url}"/>
+    <published>{published}</published>
+    <updated>{updated}</updated>
+    <summary>{summary}</summary>
+    <content type="html">{content}</content>
+  </entry>
+"""
+
+QUICK_LINKS = """
+    <div class="quick-links">
+        <h3>Другие разделы</h3>
+        <ul>
+            <li><a href="/management">Наше руководство</a></li>
+            <li><a href="/about">История компании</a></li>
+            <li><a href="/branches/London">Лондонский филиал</a></li>
+            <li><a href="/news/feed.atom">Лента новостей (Atom)</a></li>
+        </ul>
+    </div>
+    """
+
+
+def parse_front_matter(text: str) -> tuple:
+    match = _FRONT_MATTER.match(text)
+    if match is None:
+        return {}, text
+    meta = {}
+    for line in match.group(1).splitlines():
+        key, separator, value = line.partition(":")
+        if separator:
+            meta[key.strip().lower()] = value.strip()
+    return meta, text[match.end():]
+
+
+def _inline(text: str) -> str:
+    text = escape(text)
+    for pattern, replacement in _INLINE:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def render_markdown(text: str) -> str:
+    if markdown is not None:
+        return markdown.markdown(text)
+    blocks = []
+    for block in re.split(r"\n\s*\n", text.strip()):
+        lines = block.strip().splitlines()
+        if not lines:
+            continue
+        if lines[0].startswith("#"):
+            level = min(6, len(lines[0]) - len(lines[0].lstrip("#")) + 1)
+            blocks.append(f"<h{level}>{_inline(lines[0].lstrip('#').strip())}</h{level}>")
+        elif all(line.lstrip().startswith(("- ", "* ")) for line in lines):
+            items = "".join(f"<li>{_inline(line.lstrip()[2:])}</li>" for line in lines)
+            blocks.append(f"<ul>{items}</ul>")
+        else:
+            blocks.append(f"<p>{_inline(' '.join(line.strip() for line in lines))}</p>")
+    return "\n        ".join(blocks)
+
+
+def _first_paragraph(text: str) -> str:
+    for block in re.split(r"\n\s*\n", text.strip()):
+        if block.strip() and not block.lstrip().startswith("#"):
+            return " ".join(_MARKUP.sub(r"\1", block).split())
+    return ""
+
+
+class Article:
+    __slots__ = ("path", "stamp", "slug", "title", "date", "updated", "summary", "content", "card", "entry")
+
+    def __init__(self, path: Path, stamp: tuple, text: str, site_url: str):
+        meta, body = parse_front_matter(text)
+        self.path = path
+        self.stamp = stamp
+        self.slug = meta.get("slug") or path.stem
+        self.title = meta.get("title") or self.slug
+        self.date = date.fromisoformat(meta["date"])
+        self.summary = meta.get("summary") or _first_paragraph(body)
+        shown_date = self.date.strftime("%d.%m.%Y")
+        body_html = render_markdown(body)
+        self.content = ARTICLE_TEMPLATE.format(title=escape(self.title), date=shown_date, body=body_html)
+        self.card = CARD_TEMPLATE.format(
+            slug=escape(self.slug), title=escape(self.title), date=shown_date, summary=escape(self.summary)
+        )
+        url = f"{site_url}/news/{self.slug}"
+        updated = datetime.fromtimestamp(stamp[0] / 1e9, timezone.utc).replace(microsecond=0)
+        self.updated = updated.isoformat().replace("+00:00", "Z")
+        self.entry = ENTRY_TEMPLATE.format(
+            url=escape(url),
+            title=escape(self.title),
+            published=f"{self.date.isoformat()}T00:00:00Z",
+            updated=self.updated,
+            summary=escape(self.summary),
+            content=escape(body_html),
+        )
+
+    @property
+    def key(self) -> tuple:
+        # Newest first; the slug keeps articles from the same day in a stable order.
+        return (-self.date.toordinal(), self.slug)
+
+
+class NewsStore:
+    def __init__(self, root: Path, site_url: str = "", title: str = "Новости XYZ Company"):
+        self.root = root
+        self.site_url = site_url.rstrip("/")
+        self.title = title
+        self._by_path = {}
+        self._by_slug = {}
+        self._order = []
+        self._pages = {}
+        self._feed = None
+
+    def scan(self) -> dict:
+        """Stat every file and load the new and changed ones; only reads, so it can run in a thread."""
+        found = {}
+        for path in sorted(self.root.glob("*.md")):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            stamp = (stat.st_mtime_ns, stat.st_size)
+            known = self._by_path.get(path)
+            if known is not None and known.stamp == stamp:
+                found[path] = known
+                continue
+            try:
+                found[path] = Article(path, stamp, path.read_text(encoding="utf-8"), self.site_url)
+            except (OSError, KeyError, ValueError) as exc:
+                logger.warning("Skipping news article %s: %r", path, exc)
+                if known is not None:
+                    # Half-written or broken: keep serving the last good version.
+                    found[path] = known
+        return found
+
+    def apply(self, found: dict) -> set:
+        """Swap in a scan result; returns the slugs of the articles added, changed or removed."""
+        old_pages = self.page_count()
+        # Index of the first list position that changed; past any real index until one does.
+        dirty_from = sys.maxsize
+        dirty_pages = set()
+        feed_dirty = False
+        changed = set()
+        # Slugs whose owner went away or that a new file also uses.
+        contested = set()
+        added = set()
+        for path, article in list(self._by_path.items()):
+            replacement = found.get(path)
+            if replacement is article:
+                continue
+            if (
+                replacement is not None
+                and replacement.key == article.key
+                and self._by_slug.get(article.slug) is article
+            ):
+                # Edited in place: it keeps its position, so only its own list page and feed entry can differ.
+                self._by_path[path] = self._by_slug[article.slug] = replacement
+                index = bisect.bisect_left(self._order, article.key)
+                if replacement.card != article.card:
+                    dirty_pages.add(index // PAGE_SIZE + 1)
+                feed_dirty = feed_dirty or index < FEED_SIZE
+                changed.add(article.slug)
+                continue
+            del self._by_path[path]
+            if self._by_slug.get(article.slug) is not article:
+                continue
+            dirty_from = min(dirty_from, self._unlist(article))
+            changed.add(article.slug)
+            contested.add(article.slug)
+        for path, article in found.items():
+            if path in self._by_path:
+                continue
+            self._by_path[path] = article
+            added.add(path)
+            if article.slug in self._by_slug:
+                contested.add(article.slug)
+                continue
+            dirty_from = min(dirty_from, self._list(article))
+            changed.add(article.slug)
+        for slug in contested:
+            # Same rule as a full load: the first file in scan order that uses the slug serves it.
+            owner = next((article for article in found.values() if article.slug == slug), None)
+            current = self._by_slug.get(slug)
+            if owner is not current:
+                if current is not None:
+                    dirty_from = min(dirty_from, self._unlist(current))
+                if owner is not None:
+                    dirty_from = min(dirty_from, self._list(owner))
+                changed.add(slug)
+            for article in found.values():
+                if article.slug == slug and article is not owner and (article.path in added or article is current):
+                    logger.warning("News article %s reuses the slug %r; it is not served", article.path, slug)
+        new_pages = self.page_count()
+        if new_pages != old_pages:
+            # The old and new last pages gain or lose their link to the next page.
+            dirty_pages.update((old_pages, new_pages))
+        first_dirty_page = dirty_from // PAGE_SIZE + 1
+        self._pages = {
+            number: content
+            for number, content in self._pages.items()
+            if number < first_dirty_page and number not in dirty_pages
+        }
+        if feed_dirty or dirty_from < FEED_SIZE:
+            self._feed = None
+        return changed
+
+    def _list(self, article: Article) -> int:
+        self._by_slug[article.slug] = article
+        index = bisect.bisect_left(self._order, article.key)
+        self._order.insert(index, article.key)
+        return index
+
+    def _unlist(self, article: Article) -> int:
+        del self._by_slug[article.slug]
+        index = bisect.bisect_left(self._order, article.key)
+        del self._order[index]
+        return index
+
+    def refresh(self) -> set:
+        return self.apply(self.scan())
+
+    async def watch(self, interval: float, on_change=None):
+        """Poll the directory every `interval` seconds and apply what changed."""
+        while True:
+            await asyncio.sleep(interval)
+            found = await asyncio.to_thread(self.scan)
+            changed = self.apply(found)
+            if changed and on_change is not None:
+                on_change(changed)
+
+    def get(self, slug: str) -> Article | None:
+        return self._by_slug.get(slug)
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    def __iter__(self):
+        return (self._by_slug[slug] for _, slug in self._order)
+
+    def page_count(self) -> int:
+        return max(1, -(-len(self._order) // PAGE_SIZE))
+
+    def page(self, number: int) -> str | None:
+        """Content of list page `number` (1-based), or None past the last page."""
+        if not 1 <= number <= self.page_count():
+            return None
+        content = self._pages.get(number)
+        if content is None:
+            content = self._pages[number] = self._render_page(number)
+        return content
+
+    def _render_page(self, number: int) -> str:
+        keys = self._order[(number - 1) * PAGE_SIZE:number * PAGE_SIZE]
+        cards = "".join(self._by_slug[slug].card for _, slug in keys) or """
+    <div class="card"><p>Новостей пока нет.</p></div>
+    """
+        links = []
+        if number > 1:
+            newer = "/news" if number == 2 else f"/news/page/{number - 1}"
+            links.append(f'<a href="{newer}" class="btn btn-secondary" style="padding: 0.5rem 1rem; font-size: 0.9rem;">← Новее</a>')
+        links.append(f"<span>Страница {number}</span>")
+        if number < self.page_count():
+            links.append(f'<a href="/news/page/{number + 1}" class="btn" style="padding: 0.5rem 1rem; font-size: 0.9rem;">Старее →</a>')
+        pagination = "\n        ".join(links)
+        return f"""
+    <h1>Последние новости</h1>
+    {cards}
+    <nav style="display: flex; gap: 1rem; align-items: center; margin: 2rem 0;">
+        {pagination}
+    </nav>
+    {QUICK_LINKS}"""
+
+    def feed(self) -> str:
+        """The Atom feed of the newest FEED_SIZE articles, joined from cached entries."""
+        if self._feed is None:
+            articles = [self._by_slug[slug] for _, slug in self._order[:FEED_SIZE]]
+            updated = max((article.updated for article in articles), default="1970-01-01T00:00:00Z")
+            self._feed = (
+                '<?xml version="1.0" encoding="utf-8"?>\n'
+                '<feed xmlns="http://www.w3.org/2005/Atom">\n'
+                f"  <id>{escape(self.site_url)}/news</id>\n"
+                f"  <title>{escape(self.title)}</title>\n"
+                f'  <link rel="self" href="{escape(self.site_url)}/news/feed.atom"/>\n'
+                f'  <link href="{escape(self.site_url)}/news"/>\n'
+                f"  <updated>{updated}</updated>\n"
+                + "".join(article.entry for article in articles)
+                + "</feed>\n"
+            )
+        return self._feed
@@ -0,0 +1,74 @@
+import gzip
+from functools import lru_cache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# Server preference when the client accepts several codings with the same q-value.
+PREFERENCE = ("br", "zstd", "gzip")
+
+
+def _compressors() -> dict:
+    compressors = {"gzip": lambda data: gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        compressors["br"] = lambda data: brotli.compress(data, quality=11)
+    if zstandard is not None:
+        compressors["zstd"] = zstandard.ZstdCompressor(level=19).compress
+    return compressors
+
+
+COMPRESSORS = _compressors()
+AVAILABLE = tuple(coding for coding in PREFERENCE if coding in COMPRESSORS)
+
+
+def compress_variants(body: bytes, min_size: int = 256) -> dict:
+    """Compress body with every available coding, keeping only variants that are smaller."""
+    variants = {}
+    if len(body) < min_size:
+        return variants
+    for coding in AVAILABLE:
+        compressed = COMPRESSORS[coding](body)
+        if len(compressed) < len(body):
+            variants[coding] = compressed
+    return variants
+
+
+def _parse_accept_encoding(header: str) -> dict:
+    accepted = {}
+    for item in header.split(","):
+        coding, _, params = item.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+@lru_cache(maxsize=512)
+def negotiate(accept_encoding: str | None, available: tuple = AVAILABLE) -> str | None:
+    """Pick the best coding from `available` for an Accept-Encoding header, or None for identity."""
+    if not accept_encoding:
+        return None
+    accepted = _parse_accept_encoding(accept_encoding)
+    wildcard = accepted.get("*", 0.0)
+    best, best_q = None, 0.0
+    for coding in available:
+        q = accepted.get(coding, wildcard)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
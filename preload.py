@@ -0,0 +1,145 @@
+"""Link: rel=preload headers and 103 Early Hints for the critical assets of each page.
+
+The links are read once from rendered HTML, not listed by hand. They come
+from two places:
+
+- the layout's <head>: stylesheets become `rel=preload; as=style` and
+  preconnects stay preconnects;
+- for the page groups in `images`: the page's first <img>, preloaded with
+  its srcset and sizes.
+
+PageCache bakes the header into every rendered page, so a cached page
+carries it at no cost.
+
+HTTP/2 server push is gone from browsers, so the same links are also sent
+as an interim 103 Early Hints response through the ASGI
+`http.response.early_hint` extension. EarlyHintsMiddleware remembers the
+Link header of each path's last 200 and, on servers that advertise the
+extension, sends it before the app even starts on the next request. CDNs
+that turn Link headers into 103 do the same thing at the edge.
+
+Which page groups get links (PRELOAD_PAGES) and whether 103 is sent
+(EARLY_HINTS) are both switchable, so LCP can be compared with and without.
+"""
+import re
+from html import unescape
+from urllib.parse import quote
+
+from cache_backends import LRUCache
+
+
+EARLY_HINT = "http.response.early_hint"
+
+_HEAD = re.compile(r"<head>(.*?)</head>", re.DOTALL)
+_LINK_TAG = re.compile(r"<link\s([^>]*)>")
+_IMG_TAG = re.compile(r"<img\s([^>]*)>")
+_ATTR = re.compile(r'([\w-]+)(?:="([^"]*)")?')
+_LINK_SPLIT = re.compile(rb",\s*(?=<)")
+_SAFE = ":/?#[]@!$&'()*+,;=%~"
+
+
+def _attrs(tag: str) -> dict:
+    return {name.lower(): unescape(value or "") for name, value in _ATTR.findall(tag)}
+
+
+def _url(value: str) -> str:
+    return quote(value, safe=_SAFE)
+
+
+def head_links(html: str) -> list:
+    """Link header values for the stylesheets and preconnects in the <head> of `html`."""
+    head = _HEAD.search(html)
+    links = []
+    for tag in _LINK_TAG.findall(head.group(1) if head else ""):
+        attrs = _attrs(tag)
+        href = attrs.get("href")
+        rel = attrs.get("rel", "").split()
+        if not href:
+            continue
+        if "stylesheet" in rel:
+            links.append(f"<{_url(href)}>; rel=preload; as=style")
+        elif "preconnect" in rel:
+            links.append(f"<{_url(href)}>; rel=preconnect" + ("; crossorigin" if "crossorigin" in attrs else ""))
+    return links
+
+
+def hero_link(html: str) -> str | None:
+    """A high-priority image preload for the first <img> in `html`."""
+    match = _IMG_TAG.search(html)
+    if match is None:
+        return None
+    attrs = _attrs(match.group(1))
+    src = attrs.get("src")
+    if not src:
+        return None
+    link = f"<{_url(src)}>; rel=preload; as=image; fetchpriority=high"
+    if attrs.get("srcset"):
+        link += f'; imagesrcset="{attrs["srcset"]}"; imagesizes="{attrs.get("sizes", "100vw")}"'
+    return link
+
+
+class Preloads:
+    """The Link header for each page, from the layout's head plus, for `images` groups, the page's hero image."""
+
+    def __init__(self, layout: str, pages=None, images=()):
+        self.common = head_links(layout)
+        # None means every page group.
+        self.pages = None if pages is None else frozenset(pages)
+        self.images = frozenset(images)
+
+    def header(self, key: str, content: str) -> bytes | None:
+        group = key.partition(":")[0]
+        if self.pages is not None and group not in self.pages:
+            return None
+        links = list(self.common)
+        if group in self.images:
+            hero = hero_link(content)
+            if hero is not None:
+                links.append(hero)
+        return ", ".join(links).encode("latin-1") if links else None
+
+
+class EarlyHints:
+    """The Link header of each path's last 200, and how many 103s have been sent from it."""
+
+    def __init__(self, max_paths: int = 4096):
+        self.sent = 0
+        # Bounded, so requests for made-up paths cannot grow it.
+        self._links = LRUCache(max_entries=max_paths)
+
+    def get(self, path: str) -> list | None:
+        return self._links.get(path)
+
+    def remember(self, path: str, header: bytes | None):
+        if header is None:
+            self._links.pop(path)
+        else:
+            self._links.set(path, _LINK_SPLIT.split(header))
+
+    def stats(self) -> dict:
+        return {"sent": self.sent, "paths": len(self._links)}
+
+
+class EarlyHintsMiddleware:
+    """Send the Link header of a path's last 200 response as 103 Early Hints, where the server supports it."""
+
+    def __init__(self, app, hints: EarlyHints):
+        self.app = app
+        self.hints = hints
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET" or EARLY_HINT not in scope.get("extensions", {}):
+            await self.app(scope, receive, send)
+            return
+        path = scope["path"]
+        links = self.hints.get(path)
+        if links is not None:
+            self.hints.sent += 1
+            await send({"type": EARLY_HINT, "links": links})
+
+        async def remember(message):
+            if message["type"] == "http.response.start" and message["status"] == 200:
+                self.hints.remember(path, next((value for name, value in message.get("headers", ()) if name == b"link"), None))
+            await send(message)
+
+        await self.app(scope, receive, remember)
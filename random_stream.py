@@ -0,0 +1,174 @@
+"""Server-push feeds of random numbers sharing one ticker per worker.
+
+Subscribers never get a task or timer of their own: a single ticker wakes up
+TICK_HZ times a second, credits every subscriber with rate / TICK_HZ numbers
+and hands whole batches to the subscribers that are due. A subscriber that
+stops reading loses its oldest frames rather than growing its queue.
+"""
+import asyncio
+import logging
+import os
+from collections import deque
+
+import random_numbers
+
+
+logger = logging.getLogger(__name__)
+
+
+class StreamUnavailable(Exception):
+    pass
+
+
+class Subscription:
+    """One client's feed: frames wait in a short deque until the client's task picks them up."""
+
+    __slots__ = ("rate", "low", "high", "max_batch", "credit", "pending", "closed", "_waiter")
+
+    def __init__(self, rate: float, low: int, high: int, max_batch: int, max_frames: int):
+        self.rate = rate
+        self.low = low
+        self.high = high
+        self.max_batch = max_batch
+        self.credit = 0.0
+        self.pending = deque(maxlen=max_frames)
+        self.closed = False
+        self._waiter = None
+
+    def push(self, numbers: list) -> bool:
+        """Queue a frame; False if the oldest queued frame was dropped to make room."""
+        # Plain deque plus one future: asyncio.Queue costs several times more per put at this fan-out.
+        full = len(self.pending) == self.pending.maxlen
+        self.pending.append(numbers)
+        self._wake()
+        return not full
+
+    def close(self):
+        """End the feed once the frames already queued have been read."""
+        self.closed = True
+        self._wake()
+
+    def _wake(self):
+        waiter = self._waiter
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    async def frames(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self.pending:
+                if self.closed:
+                    return
+                self._waiter = loop.create_future()
+                try:
+                    await self._waiter
+                finally:
+                    self._waiter = None
+            if self.pending:
+                yield self.pending.popleft()
+
+
+class RandomTicker:
+    def __init__(
+        self,
+        tick_hz: float = 20.0,
+        max_rate: float = 1000.0,
+        max_batch: int = 1000,
+        max_subscribers: int = 10_000,
+        max_frames: int = 8,
+    ):
+        self.tick_hz = tick_hz
+        self.max_rate = max_rate
+        self.max_batch = max_batch
+        self.max_subscribers = max_subscribers
+        self.max_frames = max_frames
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.closed = False
+        self._subscribers = set()
+        self._task = None
+
+    @classmethod
+    def from_env(cls) -> "RandomTicker":
+        return cls(
+            tick_hz=float(os.environ.get("RANDOM_STREAM_TICK_HZ", "20")),
+            max_rate=float(os.environ.get("RANDOM_STREAM_MAX_RATE", "1000")),
+            max_subscribers=int(os.environ.get("RANDOM_STREAM_MAX_SUBSCRIBERS", "10000")),
+        )
+
+    def subscribe(self, rate: float, low: int, high: int, batch: int | None = None) -> Subscription:
+        if self.closed:
+            raise StreamUnavailable("The server is shutting down")
+        if len(self._subscribers) >= self.max_subscribers:
+            raise StreamUnavailable("Too many subscribers")
+        rate = min(rate, self.max_rate)
+        max_batch = min(batch or self.max_batch, self.max_batch)
+        subscription = Subscription(rate, low, high, max_batch, self.max_frames)
+        self._subscribers.add(subscription)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self._subscribers.discard(subscription)
+
+    def close(self):
+        """Refuse new subscribers and end every open feed, so shutdown does not wait on them."""
+        self.closed = True
+        for subscription in self._subscribers:
+            subscription.close()
+        self._subscribers.clear()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        interval = 1 / self.tick_hz
+        next_tick = loop.time()
+        # Ends with the last subscriber; the next subscribe starts a fresh one.
+        while self._subscribers:
+            next_tick += interval
+            delay = next_tick - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                # Fell behind: skip the missed ticks instead of bursting to catch up.
+                next_tick = loop.time()
+            self.tick(interval)
+
+    def tick(self, interval: float):
+        # Due subscribers are grouped by range so each group costs one generate
+        # call per tick, then gets sliced up. No awaits in here, so subscribers
+        # cannot change while we iterate.
+        due = {}
+        for subscription in self._subscribers:
+            credit = subscription.credit + subscription.rate * interval
+            count = int(credit)
+            if count > subscription.max_batch:
+                count = subscription.max_batch
+                credit = count
+            subscription.credit = credit - count
+            if count:
+                due.setdefault((subscription.low, subscription.high), []).append((subscription, count))
+        for (low, high), group in due.items():
+            try:
+                values = random_numbers.to_list(random_numbers.generate(sum(count for _, count in group), low, high))
+            except Exception:
+                # One bad range must not take the ticker, and every other feed, down with it.
+                logger.exception("Random stream range [%d, %d] failed; closing its %d feeds", low, high, len(group))
+                for subscription, _ in group:
+                    subscription.close()
+                    self._subscribers.discard(subscription)
+                continue
+            start = 0
+            for subscription, count in group:
+                if not subscription.push(values[start:start + count]):
+                    self.frames_dropped += 1
+                start += count
+            self.frames_sent += len(group)
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": len(self._subscribers),
+            "frames_sent": self.frames_sent,
+            "frames_dropped": self.frames_dropped,
+            "running": self._task is not None and not self._task.done(),
+        }
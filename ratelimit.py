@@ -0,0 +1,178 @@
+"""Per-client rate limiting and admission control.
+
+TokenBuckets is the bounded-memory store behind both the 404 limiter and
+RateLimitMiddleware. The middleware runs before routing and does two
+things:
+
+- Policies, matched by path prefix (longest first), give each client its
+  own bucket and answer 429 with Retry-After once it runs dry. A client is
+  its IP address, or its API key when it sends one of the configured keys
+  in X-API-Key. Unknown keys count as the IP, so made-up keys cannot mint
+  fresh buckets.
+- A global concurrency limit answers 503 with Retry-After once too many
+  requests are being worked on. That way the worker sheds load instead of
+  queueing it until every request times out. A request holds its slot
+  until its response starts, so open streams do not count against it.
+"""
+import math
+import time
+from collections import OrderedDict
+
+from inprocess import text_response
+
+
+
+class TokenBuckets:
+    """Token buckets keyed by client, bounded to `max_keys` with least-recently-used eviction.
+
+    Each key costs one dict slot and a two-item list, so even a full table
+    of 100k clients stays in the low megabytes.
+    """
+
+    def __init__(self, rate: float, burst: float, max_keys: int = 100_000):
+        if rate <= 0:
+            raise ValueError(f"Token bucket rate must be positive, got {rate}")
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+
+    def take(self, key, cost: float = 1.0, now: float | None = None) -> float:
+        """Spend `cost` tokens for `key`; returns 0.0 if allowed, else seconds until it would be."""
+        if now is None:
+            now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_keys:
+                self._buckets.popitem(last=False)
+            bucket = self._buckets[key] = [self.burst, now]
+        else:
+            self._buckets.move_to_end(key)
+            tokens = bucket[0] + (now - bucket[1]) * self.rate
+            bucket[0] = tokens if tokens < self.burst else self.burst
+            bucket[1] = now
+        if bucket[0] >= cost:
+            bucket[0] -= cost
+            return 0.0
+        return (cost - bucket[0]) / self.rate
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+def parse_policies(spec: str, scale: float = 1.0) -> dict:
+    """"/api/random=20/40,/about/=5/20" -> {prefix: (rate per second, burst)}, both multiplied by `scale`.
+
+    A rate of 0 leaves the prefix unlimited.
+    """
+    policies = {}
+    for item in spec.split(","):
+        prefix, separator, limits = item.strip().partition("=")
+        if not separator:
+            continue
+        rate, _, burst = limits.partition("/")
+        rate = float(rate)
+        if rate * scale <= 0:
+            continue
+        policies[prefix] = (rate * scale, float(burst or rate) * scale)
+    return policies
+
+
+def rejection(status: int, text: str, retry_after: float) -> tuple:
+    """Plain-text (start, body) messages for a refused request, with Retry-After in whole seconds."""
+    return text_response(status, text, [(b"retry-after", str(max(1, math.ceil(retry_after))).encode("latin-1"))])
+
+
+class RateLimiter:
+    def __init__(
+        self,
+        policies: dict,
+        max_concurrency: int = 256,
+        api_keys=(),
+        api_key_header: str = "x-api-key",
+        max_keys: int = 100_000,
+    ):
+        # Longest prefix first, so a route can have a stricter policy than its section.
+        self.policies = [
+            (prefix, TokenBuckets(rate, burst, max_keys))
+            for prefix, (rate, burst) in sorted(policies.items(), key=lambda item: -len(item[0]))
+        ]
+        self.max_concurrency = max_concurrency
+        self.api_keys = frozenset(key.encode("latin-1") for key in api_keys)
+        self.api_key_header = api_key_header.encode("latin-1")
+        self.in_flight = 0
+        self.limited = 0
+        self.shed = 0
+
+    def buckets(self, path: str) -> TokenBuckets | None:
+        for prefix, buckets in self.policies:
+            if path.startswith(prefix):
+                return buckets
+        return None
+
+    def client(self, scope):
+        if self.api_keys:
+            for name, value in scope["headers"]:
+                if name == self.api_key_header and value in self.api_keys:
+                    return value
+        client = scope.get("client")
+        return client[0] if client else None
+
+    def admit(self, scope) -> tuple | None:
+        """None to let the request through (taking a concurrency slot), else the response messages to send."""
+        buckets = self.buckets(scope["path"])
+        if buckets is not None:
+            retry_after = buckets.take(self.client(scope))
+            if retry_after:
+                self.limited += 1
+                return rejection(429, "Too Many Requests", retry_after)
+        if self.in_flight >= self.max_concurrency:
+            self.shed += 1
+            return SHED
+        self.in_flight += 1
+        return None
+
+    def release(self):
+        self.in_flight -= 1
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "limited": self.limited,
+            "shed": self.shed,
+            "clients": {prefix: len(buckets) for prefix, buckets in self.policies},
+        }
+
+
+SHED = rejection(503, "Service Unavailable", 1)
+
+
+class RateLimitMiddleware:
+    def __init__(self, app, limiter: RateLimiter):
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        limiter = self.limiter
+        rejection = limiter.admit(scope)
+        if rejection is not None:
+            await send(rejection[0])
+            await send(rejection[1])
+            return
+        held = True
+
+        async def send_and_release(message):
+            nonlocal held
+            if held and message["type"] == "http.response.start":
+                held = False
+                limiter.release()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_and_release)
+        finally:
+            if held:
+                limiter.release()
@@ -0,0 +1,359 @@
+import asyncio
+import hashlib
+import json
+import time
+from datetime import datetime
+from email.utils import formatdate, parsedate_to_datetime
+from functools import lru_cache
+
+from fastapi.responses import Response, StreamingResponse
+
+from cache_backends import LRUCache
+from precompress import compress_variants, negotiate
+
+
+DEFAULT_CACHE_CONTROL = "no-cache"
+
+
+def next_year_start() -> float:
+    return datetime(datetime.now().year + 1, 1, 1).timestamp()
+
+
+@lru_cache(maxsize=256)
+def parse_http_date(value: str) -> float | None:
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+
+
+def _parse_etags(value: str) -> list:
+    tags = []
+    for tag in value.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag:
+            tags.append(tag)
+    return tags
+
+
+def is_not_modified(headers, etags: frozenset, modified: int) -> bool:
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = _parse_etags(if_none_match)
+        return "*" in tags or not etags.isdisjoint(tags)
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since is not None:
+        since = parse_http_date(if_modified_since)
+        return since is not None and modified <= since
+    return False
+
+
+class Variant:
+    __slots__ = ("body", "etag", "raw_headers", "not_modified_headers")
+
+    def __init__(
+        self,
+        body: bytes,
+        etag: str,
+        coding: str | None,
+        last_modified: str,
+        cache_control: str,
+        content_type: str = "text/html; charset=utf-8",
+        link: bytes | None = None,
+    ):
+        self.body = body
+        self.etag = etag
+        validators = [
+            (b"etag", etag.encode("latin-1")),
+            (b"last-modified", last_modified.encode("latin-1")),
+            (b"cache-control", cache_control.encode("latin-1")),
+            (b"vary", b"Accept-Encoding"),
+        ]
+        self.not_modified_headers = validators
+        self.raw_headers = [
+            (b"content-length", str(len(body)).encode("latin-1")),
+            (b"content-type", content_type.encode("latin-1")),
+            *validators,
+        ]
+        if coding is not None:
+            self.raw_headers.append((b"content-encoding", coding.encode("latin-1")))
+        if link is not None:
+            self.raw_headers.append((b"link", link))
+
+
+class RenderedPage:
+    __slots__ = ("source", "body", "variants", "codings", "etags", "modified", "expires", "size")
+
+    def __init__(
+        self,
+        source: tuple,
+        body: bytes,
+        expires: float,
+        cache_control: str = DEFAULT_CACHE_CONTROL,
+        compressed: dict | None = None,
+        modified: int | None = None,
+        content_type: str = "text/html; charset=utf-8",
+        link: bytes | None = None,
+    ):
+        self.source = source
+        self.body = body
+        self.modified = int(time.time()) if modified is None else modified
+        last_modified = formatdate(self.modified, usegmt=True)
+        digest = hashlib.blake2b(body, digest_size=12).hexdigest()
+        if compressed is None:
+            compressed = compress_variants(body)
+        self.variants = {None: Variant(body, f'"{digest}"', None, last_modified, cache_control, content_type, link)}
+        for coding, data in compressed.items():
+            self.variants[coding] = Variant(
+                data, f'"{digest}-{coding}"', coding, last_modified, cache_control, content_type, link
+            )
+        self.codings = tuple(compressed)
+        self.etags = frozenset(variant.etag for variant in self.variants.values())
+        self.expires = expires
+        self.size = len(body) + sum(len(data) for data in compressed.values())
+
+    def dump(self) -> bytes:
+        """The page as stored in the shared tier: a JSON header line, then the body and each compressed copy."""
+        codings = list(self.codings)
+        header = {
+            "modified": self.modified,
+            "expires": self.expires,
+            "lengths": [len(self.body), *(len(self.variants[coding].body) for coding in codings)],
+            "codings": codings,
+        }
+        return b"".join([json.dumps(header).encode("utf-8"), b"\n", self.body, *(self.variants[coding].body for coding in codings)])
+
+    @classmethod
+    def load(
+        cls, source: tuple, data: bytes, cache_control: str = DEFAULT_CACHE_CONTROL, link: bytes | None = None
+    ) -> "RenderedPage":
+        newline = data.index(b"\n")
+        header = json.loads(data[:newline])
+        chunks = []
+        position = newline + 1
+        for length in header["lengths"]:
+            chunks.append(data[position:position + length])
+            position += length
+        compressed = dict(zip(header["codings"], chunks[1:]))
+        return cls(source, chunks[0], header["expires"], cache_control, compressed, header["modified"], link=link)
+
+    def variant(self, accept_encoding: str | None) -> Variant:
+        return self.variants[negotiate(accept_encoding, self.codings)]
+
+    def not_modified(self, headers) -> bool:
+        return is_not_modified(headers, self.etags, self.modified)
+
+
+class CachedResponse(Response):
+    """Response built from a prepared Variant without re-encoding or compressing anything."""
+
+    def __init__(self, variant: Variant, status_code: int = 200):
+        self.status_code = status_code
+        self.background = None
+        if status_code == 304:
+            self.body = b""
+            raw_headers = variant.not_modified_headers
+        else:
+            self.body = variant.body
+            raw_headers = variant.raw_headers
+        # Copy so that middleware appending headers never leaks into the cache.
+        self.raw_headers = list(raw_headers)
+
+
+class PageCache:
+    """Keeps every rendered page as encoded bytes until its source or the year changes.
+
+    Pages are keyed by name; the cached copy is reused as long as the
+    (title, content) pair handed in is the same and the footer year
+    baked into it is still current. `cache_control` maps the part of a
+    key before ":" (e.g. "branch" for "branch:Paris") to its Cache-Control policy.
+
+    Pages live in a bounded per-worker LRU (`local`). With a `shared` tier
+    (cache_backends.RedisCache) a local miss first looks there, under a key
+    that includes a digest of the source and year, and a page rendered here
+    is published for the other workers. Concurrent misses for one key share
+    a single load within the worker and a render lock across workers.
+
+    With `preload` (preload.Preloads) each page also carries the Link
+    header for its critical assets, worked out when the page is rendered.
+    """
+
+    # How long a render lock is held at most, and how long other workers wait on it before rendering themselves.
+    LOCK_TTL = 5.0
+    LOCK_WAIT = 1.0
+
+    def __init__(
+        self,
+        render,
+        cache_control: dict | None = None,
+        stream=None,
+        streamed=(),
+        prefer_cached=None,
+        local: LRUCache | None = None,
+        shared=None,
+        preload=None,
+    ):
+        self.render = render
+        self.cache_control = cache_control or {}
+        # Pages whose key group is in `streamed` skip the cache and go out through `stream`,
+        # except for requests `prefer_cached` picks out.
+        self.stream = stream
+        self.streamed = frozenset(streamed)
+        self.prefer_cached = prefer_cached
+        self.shared = shared
+        self.preload = preload
+        self.hits = 0
+        self.misses = 0
+        self.shared_hits = 0
+        self.coalesced = 0
+        self.not_modified = 0
+        self.streams = 0
+        self._pages = local if local is not None else LRUCache()
+        self._loading = {}
+
+    def _cached(self, key: str, source: tuple) -> RenderedPage | None:
+        page = self._pages.get(key)
+        if page is not None and page.source == source and time.time() < page.expires:
+            self.hits += 1
+            return page
+        return None
+
+    def _cache_control(self, key: str) -> str:
+        return self.cache_control.get(key.partition(":")[0], DEFAULT_CACHE_CONTROL)
+
+    def _link(self, key: str, content) -> bytes | None:
+        if self.preload is None or not isinstance(content, str):
+            return None
+        return self.preload.header(key, content)
+
+    def _render(self, key: str, source: tuple) -> RenderedPage:
+        self.misses += 1
+        body = self.render(*source)
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        page = RenderedPage(
+            source, body, next_year_start(), self._cache_control(key), link=self._link(key, source[1])
+        )
+        self._pages.set(key, page, page.size)
+        return page
+
+    def get(self, key: str, title: str, content: str) -> RenderedPage:
+        """The page from this worker's cache, rendered if needed; never consults the shared tier."""
+        source = (title, content)
+        return self._cached(key, source) or self._render(key, source)
+
+    async def fetch(self, key: str, title: str, content: str) -> RenderedPage:
+        source = (title, content)
+        page = self._cached(key, source)
+        if page is not None:
+            return page
+        if self.shared is None:
+            return self._render(key, source)
+        loading = self._loading.get(key)
+        if loading is not None and loading[0] == source:
+            self.coalesced += 1
+            return await asyncio.shield(loading[1])
+        task = asyncio.ensure_future(self._load(key, source))
+        self._loading[key] = (source, task)
+        try:
+            # Shielded so a client going away does not cancel the load for everyone waiting on it.
+            return await asyncio.shield(task)
+        finally:
+            if self._loading.get(key, (None, None))[1] is task:
+                del self._loading[key]
+
+    def _shared_key(self, key: str, source: tuple) -> str:
+        digest = hashlib.blake2b(digest_size=12)
+        for part in (str(datetime.now().year), *source):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return f"{key}:{digest.hexdigest()}"
+
+    async def _load(self, key: str, source: tuple) -> RenderedPage:
+        shared_key = self._shared_key(key, source)
+        data = await self.shared.get(shared_key)
+        if data is None:
+            if await self.shared.acquire(shared_key, self.LOCK_TTL):
+                try:
+                    page = self._render(key, source)
+                    await self.shared.set(shared_key, page.dump(), page.expires - time.time())
+                finally:
+                    await self.shared.release(shared_key)
+                return page
+            # Another worker is rendering it; wait for its copy rather than rendering again.
+            deadline = time.monotonic() + self.LOCK_WAIT
+            while data is None and time.monotonic() < deadline:
+                await asyncio.sleep(0.01)
+                data = await self.shared.get(shared_key)
+            if data is None:
+                return self._render(key, source)
+        self.shared_hits += 1
+        page = RenderedPage.load(source, data, self._cache_control(key), self._link(key, source[1]))
+        self._pages.set(key, page, page.size)
+        return page
+
+    def stream_response(self, key: str, title: str, content, status_code: int = 200) -> StreamingResponse:
+        """Send the page head and nav at once and the body as it is produced; content may be an async iterable."""
+        self.streams += 1
+        headers = {"cache-control": self._cache_control(key)}
+        link = self._link(key, content)
+        if link is not None:
+            headers["link"] = link.decode("latin-1")
+        return StreamingResponse(
+            self.stream(title, content),
+            status_code=status_code,
+            headers=headers,
+            media_type="text/html",
+        )
+
+    async def response(self, request, key: str, title: str, content: str, status_code: int = 200) -> Response:
+        if (
+            self.streamed
+            and key.partition(":")[0] in self.streamed
+            and not (self.prefer_cached is not None and self.prefer_cached(request))
+        ):
+            return self.stream_response(key, title, content, status_code)
+        page = self._cached(key, (title, content)) or await self.fetch(key, title, content)
+        return self._respond(request, page, status_code)
+
+    def document(self, request, key: str, body: str, content_type: str) -> Response:
+        """A cached, compressed response for a document outside the page layout, such as a feed."""
+        source = (body,)
+        page = self._cached(key, source)
+        if page is None:
+            self.misses += 1
+            page = RenderedPage(
+                source, body.encode("utf-8"), next_year_start(), self._cache_control(key), content_type=content_type
+            )
+            self._pages.set(key, page, page.size)
+        return self._respond(request, page, 200)
+
+    def _respond(self, request, page: RenderedPage, status_code: int) -> Response:
+        headers = request.headers
+        variant = page.variant(headers.get("accept-encoding"))
+        if status_code == 200 and page.not_modified(headers):
+            self.not_modified += 1
+            return CachedResponse(variant, 304)
+        return CachedResponse(variant, status_code)
+
+    def invalidate(self, key: str | None = None):
+        # Local only: shared copies are keyed by source digest, so a changed page never matches a stale one.
+        if key is None:
+            self._pages.clear()
+        else:
+            self._pages.pop(key)
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "shared_hits": self.shared_hits,
+            "coalesced": self.coalesced,
+            "not_modified": self.not_modified,
+            "streams": self.streams,
+            "pages": len(self._pages),
+            "bytes": self._pages.bytes,
+            "evictions": self._pages.evictions,
+        }
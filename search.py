@@ -0,0 +1,284 @@
+"""Full-text search over the site's pages: an in-memory inverted index ranked with BM25.
+
+Text is lower-cased, ё folded into е, stop words dropped, and Russian words
+reduced with the Snowball Russian stemmer, either the `snowballstemmer`
+package when it is installed or the built-in port below. Postings are
+parallel array("I") columns of document ids and term frequencies, so
+even a large vocabulary costs a few bytes per occurrence. Documents can be
+added, replaced and removed one at a time, so a changed page is re-indexed
+without a rebuild. The last word of a query also matches as a prefix, which
+is what the autocomplete needs.
+"""
+import bisect
+import hashlib
+import logging
+import math
+import re
+from array import array
+from functools import lru_cache
+from html import unescape
+
+from pydantic import BaseModel
+
+try:
+    import snowballstemmer
+except ImportError:
+    snowballstemmer = None
+
+from inprocess import request
+
+
+logger = logging.getLogger(__name__)
+
+K1 = 1.2
+B = 0.75
+TITLE_WEIGHT = 3
+MAX_PREFIX_TERMS = 50
+SNIPPET_CHARS = 160
+
+_WORD = re.compile(r"\w+")
+_TAG = re.compile(r"<[^>]+>")
+_MAIN = re.compile(r"<main>(.*)</main>", re.DOTALL)
+_TITLE = re.compile(r"<title>(.*?)(?: \| [^<]*)?</title>", re.DOTALL)
+_CYRILLIC = re.compile(r"[а-я]")
+
+STOP_WORDS = frozenset(
+    "и в во не что он на я с со как а то все она так его но да ты к у же вы за бы по только ее мне было вот "
+    "от меня еще нет о из ему теперь когда даже ну вдруг ли если уже или ни быть был него до вас нибудь "
+    "опять уж вам ведь там потом себя ничего ей может они тут где есть надо ней для мы тебя их чем была "
+    "сам чтоб без будто чего раз тоже себе под будет ж тогда кто этот того потому этого какой совсем ним "
+    "здесь этом один почти мой тем чтобы нее сейчас были куда зачем всех никогда можно при наконец два об "
+    "другой хоть после над больше тот через эти нас про всего них какая много разве три эту моя впрочем "
+    "хорошо свою этой перед иногда лучше чуть том нельзя такой им более всегда конечно всю между "
+    "the a an and or of to in on for is are with by at from".split()
+)
+
+# Snowball Russian stemmer (https://snowballstem.org/algorithms/russian/stemmer.html).
+# Every pattern is matched against the RV region only, so the "preceded by а or я"
+# look-behinds cannot reach outside it; the leftmost match is the longest ending.
+_VOWELS = frozenset("аеиоуыэюя")
+_PERFECTIVE_GERUND = re.compile(r"(?:(?<=[ая])(?:в|вши|вшись)|ив|ивши|ившись|ыв|ывши|ывшись)$")
+_REFLEXIVE = re.compile(r"(?:ся|сь)$")
+_ADJECTIVE = r"(?:ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому|их|ых|ую|юю|ая|яя|ою|ею)"
+_PARTICIPLE = r"(?:(?<=[ая])(?:ем|нн|вш|ющ|щ)|ивш|ывш|ующ)"
+_ADJECTIVAL = re.compile(rf"{_PARTICIPLE}?{_ADJECTIVE}$")
+_VERB = re.compile(
+    r"(?:(?<=[ая])(?:ла|на|ете|йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно)|"
+    r"ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло|ено|ят|ует|уют|ит|ыт|ены|ить|ыть|ишь|ую|ю)$"
+)
+_NOUN = re.compile(
+    r"(?:а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием|ем|ам|ом|о|у|ах|иях|ях|ы|ь|ию|ью|ю|ия|ья|я)$"
+)
+_DERIVATIONAL = re.compile(r"(?:ост|ость)$")
+_SUPERLATIVE = re.compile(r"(?:ейш|ейше)$")
+
+
+def _region_after_vowel_consonant(word: str, start: int) -> int:
+    for index in range(start + 1, len(word)):
+        if word[index - 1] in _VOWELS and word[index] not in _VOWELS:
+            return index + 1
+    return len(word)
+
+
+def _snowball_russian(word: str) -> str:
+    rv = next((index + 1 for index, char in enumerate(word) if char in _VOWELS), len(word))
+    r2 = _region_after_vowel_consonant(word, _region_after_vowel_consonant(word, 0))
+    head, tail = word[:rv], word[rv:]
+    match = _PERFECTIVE_GERUND.search(tail)
+    if match is not None:
+        tail = tail[:match.start()]
+    else:
+        tail = _REFLEXIVE.sub("", tail, count=1)
+        for pattern in (_ADJECTIVAL, _VERB, _NOUN):
+            match = pattern.search(tail)
+            if match is not None:
+                tail = tail[:match.start()]
+                break
+    if tail.endswith("и"):
+        tail = tail[:-1]
+    match = _DERIVATIONAL.search(tail)
+    if match is not None and rv + match.start() >= r2:
+        tail = tail[:match.start()]
+    match = _SUPERLATIVE.search(tail)
+    if match is not None:
+        tail = tail[:match.start()]
+    if tail.endswith("нн"):
+        tail = tail[:-1]
+    elif match is None and tail.endswith("ь"):
+        tail = tail[:-1]
+    return head + tail
+
+
+if snowballstemmer is not None:
+    _stemmer = snowballstemmer.stemmer("russian")
+
+    def _stem_russian(word: str) -> str:
+        return _stemmer.stemWord(word)
+else:
+    _stem_russian = _snowball_russian
+
+
+@lru_cache(maxsize=65536)
+def stem(word: str) -> str:
+    word = word.lower().replace("ё", "е")
+    return _stem_russian(word) if _CYRILLIC.search(word) else word
+
+
+def tokens(text: str):
+    """(stem, offset) for every indexable word of `text`."""
+    for match in _WORD.finditer(text):
+        word = match.group().lower()
+        if word not in STOP_WORDS and (len(word) > 1 or word.isdigit()):
+            yield stem(word), match.start()
+
+
+def html_text(html: str) -> str:
+    return " ".join(unescape(_TAG.sub(" ", html)).split())
+
+
+class SearchResult(BaseModel):
+    url: str
+    title: str
+    snippet: str
+    score: float
+
+
+class SearchResults(BaseModel):
+    query: str
+    total: int
+    results: list[SearchResult]
+
+
+class Document:
+    __slots__ = ("id", "url", "title", "text", "length", "digest", "first_offsets")
+
+    def __init__(self, doc_id: int, url: str, title: str, text: str, digest: bytes):
+        self.id = doc_id
+        self.url = url
+        self.title = title
+        self.text = text
+        self.digest = digest
+        self.length = 0
+        self.first_offsets = {}
+
+
+class SearchIndex:
+    def __init__(self):
+        self._documents = {}
+        self._by_url = {}
+        # term -> (doc ids, term frequencies), both array("I") and sorted by doc id.
+        self._postings = {}
+        self._terms = None
+        self._next_id = 0
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._by_url)
+
+    def update(self, url: str, title: str, html: str) -> bool:
+        """Index (or re-index) the page at `url`; False when its text has not changed."""
+        text = html_text(html)
+        digest = hashlib.blake2b(f"{title}\0{text}".encode("utf-8"), digest_size=16).digest()
+        known = self._by_url.get(url)
+        if known is not None and known.digest == digest:
+            return False
+        self.remove(url)
+        document = Document(self._next_id, url, title, text, digest)
+        self._next_id += 1
+        frequencies = {}
+        for term, _ in tokens(title):
+            frequencies[term] = frequencies.get(term, 0) + TITLE_WEIGHT
+        for term, offset in tokens(text):
+            frequencies[term] = frequencies.get(term, 0) + 1
+            document.first_offsets.setdefault(term, offset)
+        document.length = sum(frequencies.values())
+        for term, frequency in frequencies.items():
+            posting = self._postings.get(term)
+            if posting is None:
+                posting = self._postings[term] = (array("I"), array("I"))
+                self._terms = None
+            # New documents always get the highest id, so appending keeps postings sorted.
+            posting[0].append(document.id)
+            posting[1].append(frequency)
+        self._documents[document.id] = document
+        self._by_url[url] = document
+        self._total_length += document.length
+        return True
+
+    def remove(self, url: str):
+        document = self._by_url.pop(url, None)
+        if document is None:
+            return
+        del self._documents[document.id]
+        self._total_length -= document.length
+        for term, _ in tokens(document.title + " " + document.text):
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            ids, frequencies = posting
+            index = bisect.bisect_left(ids, document.id)
+            if index < len(ids) and ids[index] == document.id:
+                del ids[index]
+                del frequencies[index]
+                if not ids:
+                    del self._postings[term]
+                    self._terms = None
+
+    def _prefix_terms(self, prefix: str) -> list:
+        if self._terms is None:
+            self._terms = sorted(self._postings)
+        start = bisect.bisect_left(self._terms, prefix)
+        end = bisect.bisect_left(self._terms, prefix + "\uffff", start)
+        return self._terms[start:min(end, start + MAX_PREFIX_TERMS)]
+
+    def search(self, query: str, limit: int = 10) -> tuple:
+        """(total matches, [(score, document), ...] best first); the last query word also matches as a prefix."""
+        words = [word.lower().replace("ё", "е") for word in _WORD.findall(query)]
+        terms = {stem(word) for word in words if word not in STOP_WORDS}
+        last = words[-1] if words else ""
+        # A stop word or a single letter would expand to a good part of the vocabulary.
+        if len(last) > 1 and last not in STOP_WORDS and not query[-1:].isspace():
+            terms.update(self._prefix_terms(last))
+        count = len(self._documents)
+        if not terms or not count:
+            return 0, []
+        average_length = self._total_length / count
+        scores = {}
+        for term in terms:
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            ids, frequencies = posting
+            idf = math.log(1 + (count - len(ids) + 0.5) / (len(ids) + 0.5))
+            for doc_id, frequency in zip(ids, frequencies):
+                norm = K1 * (1 - B + B * self._documents[doc_id].length / average_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (K1 + 1) / (frequency + norm)
+        best = sorted(scores.items(), key=lambda item: -item[1])[:limit]
+        return len(scores), [(score, self._documents[doc_id]) for doc_id, score in best]
+
+    def snippet(self, document: Document, query: str) -> str:
+        terms = {stem(word) for word in _WORD.findall(query)}
+        offsets = [document.first_offsets[term] for term in terms if term in document.first_offsets]
+        start = max(0, min(offsets) - SNIPPET_CHARS // 4) if offsets else 0
+        text = document.text[start:start + SNIPPET_CHARS]
+        return ("…" if start else "") + text + ("…" if start + SNIPPET_CHARS < len(document.text) else "")
+
+
+def parse_page(html: str) -> tuple:
+    """(title, main content) of a page rendered with the site layout."""
+    title = _TITLE.search(html)
+    main = _MAIN.search(html)
+    return unescape(title.group(1)) if title else "", main.group(1) if main else html
+
+
+async def index_site(app, index: SearchIndex, paths) -> int:
+    """Fetch every path through the app and index the HTML ones; returns how many documents changed."""
+    changed = 0
+    for path in paths:
+        status, headers, body = await request(app, path, headers=[("user-agent", "search-indexer")], internal=True)
+        content_type = dict(headers).get(b"content-type", b"")
+        if status != 200 or not content_type.startswith(b"text/html"):
+            continue
+        title, content = parse_page(body.decode("utf-8"))
+        changed += index.update(path, title, content)
+    return changed
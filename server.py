@@ -0,0 +1,65 @@
+"""Run the app under uvicorn.
+
+    python -m server --workers 4 --loop uvloop --http httptools
+    python -m server --uds /run/xyz.sock
+
+Every option can also come from the environment (APP_WORKERS, APP_LOOP, ...),
+which is what the deployment scripts use. For gunicorn, point it at the
+importable app instead: gunicorn main:app -k uvicorn.workers.UvicornWorker.
+"""
+import argparse
+import os
+
+import uvicorn
+
+
+def _env(name: str, default):
+    value = os.environ.get(f"APP_{name.upper()}")
+    if value is None:
+        return default
+    return type(default)(value) if default is not None else value
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Run the XYZ Company site.")
+    parser.add_argument("--host", default=_env("host", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=_env("port", 8000))
+    parser.add_argument("--uds", default=_env("uds", None), help="bind to a Unix domain socket instead of host/port")
+    parser.add_argument("--workers", type=int, default=_env("workers", 1))
+    parser.add_argument("--loop", choices=["auto", "asyncio", "uvloop"], default=_env("loop", "auto"))
+    parser.add_argument("--http", choices=["auto", "h11", "httptools"], default=_env("http", "auto"))
+    parser.add_argument("--backlog", type=int, default=_env("backlog", 2048))
+    parser.add_argument("--keep-alive", type=int, default=_env("keep_alive", 5), help="keep-alive timeout in seconds")
+    parser.add_argument(
+        "--graceful-timeout",
+        type=int,
+        default=_env("graceful_timeout", 30),
+        help="seconds to let in-flight requests finish on shutdown before cancelling them",
+    )
+    parser.add_argument("--limit-concurrency", type=int, default=_env("limit_concurrency", None))
+    parser.add_argument("--log-level", default=_env("log_level", "info"))
+    parser.add_argument("--no-access-log", action="store_true", default=_env("no_access_log", "") == "1")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    uvicorn.run(
+        "main:app",
+        host=args.host,
+        port=args.port,
+        uds=args.uds,
+        workers=args.workers,
+        loop=args.loop,
+        http=args.http,
+        backlog=args.backlog,
+        timeout_keep_alive=args.keep_alive,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        limit_concurrency=args.limit_concurrency,
+        log_level=args.log_level,
+        access_log=not args.no_access_log,
+    )
+
+
+if __name__ == "__main__":
+    main()
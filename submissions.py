@@ -0,0 +1,169 @@
+"""Contact-form submissions: validated on the request, persisted in batches off the event loop.
+
+Handlers only put a validated submission on a bounded asyncio queue. One
+background writer drains it and stores each batch with a single commit
+(SQLite in WAL mode) or a single fsync (JSONL spool), so request latency
+does not depend on the disk. When the queue is full the handler refuses the
+submission with 503 instead of letting memory grow.
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+from pydantic import BaseModel, Field
+
+
+logger = logging.getLogger(__name__)
+
+
+class ContactSubmission(BaseModel):
+    name: str = Field(min_length=1, max_length=200)
+    email: str = Field(max_length=320, pattern=r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+    message: str = Field(min_length=1, max_length=5000)
+
+
+class SQLiteStore:
+    def __init__(self, path: Path):
+        self.path = path
+        self._connection = None
+
+    def open(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS submissions ("
+            "id INTEGER PRIMARY KEY, received REAL NOT NULL, branch TEXT, "
+            "name TEXT NOT NULL, email TEXT NOT NULL, message TEXT NOT NULL)"
+        )
+        connection.commit()
+        self._connection = connection
+
+    def write(self, batch: list):
+        with self._connection:
+            self._connection.executemany(
+                "INSERT INTO submissions (received, branch, name, email, message) VALUES (?, ?, ?, ?, ?)",
+                [(received, branch, item.name, item.email, item.message) for received, branch, item in batch],
+            )
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+class JSONLStore:
+    def __init__(self, path: Path):
+        self.path = path
+        self._file = None
+
+    def open(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, "ab")
+
+    def write(self, batch: list):
+        lines = [
+            json.dumps({"received": received, "branch": branch, **item.model_dump()}, ensure_ascii=False).encode("utf-8")
+            for received, branch, item in batch
+        ]
+        self._file.write(b"\n".join(lines) + b"\n")
+        self._file.flush()
+        # One fsync per batch is the whole point of batching.
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def open_store(path: Path):
+    return JSONLStore(path) if path.suffix == ".jsonl" else SQLiteStore(path)
+
+
+class SubmissionWriter:
+    def __init__(self, store, max_queue: int = 10_000, batch_size: int = 500, linger: float = 0.05):
+        self.store = store
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.batch_size = batch_size
+        self.linger = linger
+        self.accepted = 0
+        self.rejected = 0
+        self.written = 0
+        self.batches = 0
+        self._task = None
+        self._closing = False
+
+    def submit(self, submission: ContactSubmission, branch: str | None = None) -> bool:
+        """Queue a submission; False means the queue is full and the caller should shed it."""
+        try:
+            self.queue.put_nowait((time.time(), branch, submission))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return False
+        self.accepted += 1
+        return True
+
+    async def start(self):
+        await asyncio.to_thread(self.store.open)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._closing = True
+        if self._task is not None:
+            try:
+                # Wakes the writer if it is idle; a full queue means it is busy and will notice _closing.
+                self.queue.put_nowait(None)
+            except asyncio.QueueFull:
+                pass
+            await self._task
+            self._task = None
+        # Whatever is still queued is written before shutdown completes.
+        while not self.queue.empty():
+            await self._write(self._drain([]))
+        await asyncio.to_thread(self.store.close)
+
+    def _drain(self, batch: list) -> list:
+        while len(batch) < self.batch_size:
+            try:
+                item = self.queue.get_nowait()
+            except asyncio.QueueEmpty:
+                break
+            if item is not None:
+                batch.append(item)
+        return batch
+
+    async def _run(self):
+        while not self._closing:
+            item = await self.queue.get()
+            if item is None:
+                break
+            if self.linger and self.queue.qsize() < self.batch_size:
+                # Give a burst a moment to pile up so it shares one commit.
+                await asyncio.sleep(self.linger)
+            await self._write(self._drain([item]))
+
+    async def _write(self, batch: list):
+        if not batch:
+            return
+        try:
+            await asyncio.to_thread(self.store.write, batch)
+        except Exception:
+            logger.exception("Failed to store %d contact submissions", len(batch))
+            return
+        self.written += len(batch)
+        self.batches += 1
+
+    def stats(self) -> dict:
+        return {
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "written": self.written,
+            "batches": self.batches,
+            "queued": self.queue.qsize(),
+        }
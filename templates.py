@@ -0,0 +1,103 @@
+import re
+from functools import lru_cache
+from pathlib import Path
+
+
+_SLOT = re.compile(r"{{\s*(\w+)\s*}}")
+
+
+@lru_cache(maxsize=4096)
+def encode_fragment(value: str) -> bytes:
+    """UTF-8 bytes of a page fragment; page bodies are long-lived strings, so each is encoded once."""
+    return value.encode("utf-8")
+
+
+class Template:
+    """A template compiled once into pre-encoded literal chunks and named slots.
+
+    Placeholders are written {{ name }} and substituted verbatim, without
+    escaping. `bind` fills some slots ahead of time and fuses them into the
+    neighbouring literals, so whatever is fixed (nav, stylesheet link, the
+    footer for the current year) is encoded once instead of on every render.
+    """
+
+    __slots__ = ("parts", "slots")
+
+    def __init__(self, parts: list):
+        # Literals are bytes, slots are str names; adjacent literals are always merged.
+        self.parts = parts
+        self.slots = frozenset(part for part in parts if isinstance(part, str))
+
+    @classmethod
+    def compile(cls, source: str) -> "Template":
+        parts = []
+        for index, piece in enumerate(_SLOT.split(source)):
+            if index % 2:
+                parts.append(piece)
+            elif piece:
+                parts.append(piece.encode("utf-8"))
+        return cls(parts)
+
+    @classmethod
+    def load(cls, path: Path) -> "Template":
+        return cls.compile(path.read_text(encoding="utf-8"))
+
+    def bind(self, **values) -> "Template":
+        parts = []
+        for part in self.parts:
+            if isinstance(part, str) and part in values:
+                value = values[part]
+                part = value.render() if isinstance(value, Template) else value.encode("utf-8")
+            if isinstance(part, bytes) and parts and isinstance(parts[-1], bytes):
+                parts[-1] += part
+            elif part:
+                parts.append(part)
+        return Template(parts)
+
+    def render_iter(self, **values):
+        for part in self.parts:
+            if part.__class__ is bytes:
+                yield part
+            else:
+                yield encode_fragment(values[part])
+
+    async def stream(self, **values):
+        """Yield the rendered template in chunks, flushing everything before each streamed value.
+
+        A value may be a str or an (async) iterable of str; iterables are sent
+        piece by piece as they are produced, so the literal head of the page
+        reaches the client before the body has been generated.
+        """
+        pending = []
+        for part in self.parts:
+            if part.__class__ is bytes:
+                pending.append(part)
+                continue
+            value = values[part]
+            if isinstance(value, str):
+                pending.append(encode_fragment(value))
+                continue
+            if pending:
+                yield b"".join(pending)
+                pending = []
+            if hasattr(value, "__aiter__"):
+                async for piece in value:
+                    yield piece.encode("utf-8")
+            else:
+                for piece in value:
+                    yield piece.encode("utf-8")
+        if pending:
+            yield b"".join(pending)
+
+    def render(self, **values) -> bytes:
+        try:
+            return b"".join([part if part.__class__ is bytes else encode_fragment(values[part]) for part in self.parts])
+        except KeyError as exc:
+            raise KeyError(f"Unfilled template slot: {exc.args[0]}") from None
+
+    def render_once(self, **values) -> bytes:
+        """Like render, for one-off values (a search result page): they bypass encode_fragment's cache."""
+        try:
+            return b"".join([part if part.__class__ is bytes else values[part].encode("utf-8") for part in self.parts])
+        except KeyError as exc:
+            raise KeyError(f"Unfilled template slot: {exc.args[0]}") from None
@@ -0,0 +1,92 @@
+"""NewsStore.apply: an incremental update must leave the store as a full load of the same files would."""
+import os
+
+import pytest
+
+from news import PAGE_SIZE, NewsStore
+
+
+@pytest.fixture
+def root(tmp_path):
+    return tmp_path
+
+
+def write(root, name: str, day: int, slug: str | None = None, body: str = "Text."):
+    path = root / f"{name}.md"
+    front = f"title: {name}\ndate: 2024-01-{day:02d}\n" + (f"slug: {slug}\n" if slug else "")
+    path.write_text(f"---\n{front}---\n{body}\n", encoding="utf-8")
+    # A distinct mtime even on coarse file systems, so the scan sees the change.
+    stamp = path.stat().st_mtime_ns + day * 1_000_000_000 + len(body)
+    os.utime(path, ns=(stamp, stamp))
+
+
+def served(store: NewsStore) -> tuple:
+    pages = [store.page(number) for number in range(1, store.page_count() + 1)]
+    return [(article.slug, article.path.name) for article in store], pages, store.feed()
+
+
+def assert_matches_full_load(store: NewsStore, root):
+    fresh = NewsStore(root, "https://example.org")
+    fresh.refresh()
+    assert served(store) == served(fresh)
+
+
+def loaded(root) -> NewsStore:
+    store = NewsStore(root, "https://example.org")
+    store.refresh()
+    # Render everything, so stale list pages or feed would show.
+    served(store)
+    return store
+
+
+def test_add_edit_remove(root):
+    for day in range(1, PAGE_SIZE + 6):
+        write(root, f"a{day:02d}", day)
+    store = loaded(root)
+    write(root, "a03", 3, body="Edited.")
+    assert store.refresh() == {"a03"}
+    assert_matches_full_load(store, root)
+    write(root, "a99", 28)
+    (root / "a07.md").unlink()
+    assert store.refresh() == {"a99", "a07"}
+    assert_matches_full_load(store, root)
+
+
+def test_duplicate_slug_owner_removed(root):
+    write(root, "a", 1, slug="x", body="From a.")
+    write(root, "b", 2, slug="x", body="From b.")
+    store = loaded(root)
+    assert store.get("x").path.name == "a.md"
+    (root / "a.md").unlink()
+    assert store.refresh() == {"x"}
+    assert store.get("x").path.name == "b.md"
+    assert_matches_full_load(store, root)
+
+
+def test_duplicate_slug_owner_renamed(root):
+    write(root, "a", 1, slug="x")
+    write(root, "b", 2, slug="x")
+    store = loaded(root)
+    write(root, "a", 1, slug="y")
+    assert store.refresh() == {"x", "y"}
+    assert store.get("x").path.name == "b.md"
+    assert_matches_full_load(store, root)
+
+
+def test_duplicate_slug_added_before_owner(root):
+    write(root, "b", 2, slug="x")
+    store = loaded(root)
+    write(root, "a", 1, slug="x")
+    assert store.refresh() == {"x"}
+    assert store.get("x").path.name == "a.md"
+    assert_matches_full_load(store, root)
+
+
+def test_duplicate_slug_added_after_owner(root):
+    write(root, "a", 1, slug="x")
+    store = loaded(root)
+    feed = store.feed()
+    write(root, "b", 2, slug="x")
+    assert store.refresh() == set()
+    assert store.feed() is feed
+    assert_matches_full_load(store, root)
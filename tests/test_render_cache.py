@@ -0,0 +1,74 @@
+"""PageCache against the shared tier, with cache_backends.StandInServer standing in for Redis."""
+import asyncio
+import socket
+
+from cache_backends import RedisCache, StandInServer
+from render_cache import PageCache
+
+
+SOURCE = ("Title", "<p>Content</p>")
+
+
+def render(title: str, content: str) -> str:
+    render.calls += 1
+    return f"<html><title>{title}</title><body>{content}</body></html>"
+
+
+def caches(url: str) -> tuple:
+    render.calls = 0
+    # One RedisCache each, as two workers would have.
+    return PageCache(render, shared=RedisCache(url)), PageCache(render, shared=RedisCache(url))
+
+
+async def with_server(test):
+    server = await asyncio.start_server(StandInServer().handle, "127.0.0.1", 0)
+    async with server:
+        port = server.sockets[0].getsockname()[1]
+        return await test(f"redis://127.0.0.1:{port}")
+
+
+def test_second_cache_takes_the_shared_copy():
+    async def test(url):
+        first, second = caches(url)
+        rendered = await first.fetch("page", *SOURCE)
+        shared = await second.fetch("page", *SOURCE)
+        await first.shared.close()
+        await second.shared.close()
+        return first, second, rendered, shared
+
+    first, second, rendered, shared = asyncio.run(with_server(test))
+    assert render.calls == 1
+    assert (first.misses, second.misses, second.shared_hits) == (1, 0, 1)
+    assert shared.body == rendered.body
+    assert shared.etags == rendered.etags
+    assert shared.modified == rendered.modified
+
+
+def test_concurrent_misses_render_once():
+    async def test(url):
+        first, second = caches(url)
+        pages = await asyncio.gather(first.fetch("page", *SOURCE), second.fetch("page", *SOURCE))
+        await first.shared.close()
+        await second.shared.close()
+        return pages
+
+    rendered, shared = asyncio.run(with_server(test))
+    assert render.calls == 1
+    assert shared.etags == rendered.etags
+
+
+def test_server_down_renders_locally():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    # Nothing listens on the port any more.
+    first, second = caches(f"redis://127.0.0.1:{port}")
+
+    async def test():
+        return await first.fetch("page", *SOURCE), await second.fetch("page", *SOURCE)
+
+    rendered, again = asyncio.run(test())
+    assert render.calls == 2
+    assert rendered.body == again.body
+    assert first.shared.errors == second.shared.errors == 1
+    assert first.shared_hits == second.shared_hits == 0
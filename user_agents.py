@@ -0,0 +1,133 @@
+"""User-Agent parsing with compiled rules and a bounded cache.
+
+Real traffic carries only a few hundred distinct User-Agent strings, so
+every string is parsed once and the result kept in an LRU of
+USER_AGENT_CACHE_SIZE entries. Rules are tried in order and the first match
+wins, which is why Edge, Opera and the other Chromium browsers come before
+Chrome, and Chrome comes before Safari.
+"""
+import os
+import re
+from functools import lru_cache
+from typing import NamedTuple
+
+from pydantic import BaseModel, Field
+
+
+MAX_LENGTH = 512
+MAX_BATCH = 1000
+
+_BOT = re.compile(
+    r"bot\b|bot/|crawl|spider|slurp|archiver|facebookexternalhit|embedly|preview|"
+    r"curl/|wget/|python-requests|python-urllib|httpx|aiohttp|go-http-client|java/|okhttp|"
+    r"headlesschrome|lighthouse|pingdom|uptimerobot|monitor",
+    re.IGNORECASE,
+)
+
+_BROWSERS = [
+    (name, re.compile(pattern))
+    for name, pattern in (
+        ("Edge", r"(?:Edg|Edge|EdgA|EdgiOS)/([\d.]+)"),
+        ("Yandex Browser", r"YaBrowser/([\d.]+)"),
+        ("Opera", r"(?:OPR|OPT|Opera)/([\d.]+)"),
+        ("Samsung Internet", r"SamsungBrowser/([\d.]+)"),
+        ("Vivaldi", r"Vivaldi/([\d.]+)"),
+        ("Firefox", r"(?:Firefox|FxiOS)/([\d.]+)"),
+        ("Chrome", r"(?:Chrome|CriOS)/([\d.]+)"),
+        ("Safari", r"Version/([\d.]+).*Safari/"),
+        ("Internet Explorer", r"(?:MSIE |Trident/.*rv:)([\d.]+)"),
+    )
+]
+
+_WINDOWS_VERSIONS = {"10.0": "10", "6.3": "8.1", "6.2": "8", "6.1": "7", "6.0": "Vista", "5.1": "XP"}
+
+_SYSTEMS = [
+    (name, re.compile(pattern))
+    for name, pattern in (
+        ("Windows", r"Windows NT ([\d.]+)"),
+        ("Android", r"Android ([\d.]+)?"),
+        ("iOS", r"(?:iPhone|iPad|iPod).*? OS ([\d_]+)"),
+        ("Chrome OS", r"CrOS \S+ ([\d.]+)"),
+        ("macOS", r"Mac OS X ([\d_.]+)?"),
+        ("Linux", r"Linux()"),
+    )
+]
+
+_TV = re.compile(r"SmartTV|SMART-TV|Tizen.*TV|Web0S|HbbTV|AppleTV|CrKey", re.IGNORECASE)
+_TABLET = re.compile(r"iPad|Tablet|Kindle|Silk/|PlayBook")
+_MOBILE = re.compile(r"Mobi|iPhone|iPod|Android.*Mobile|Windows Phone|Opera Mini")
+
+
+class UserAgent(NamedTuple):
+    user_agent: str
+    browser: str | None
+    version: str | None
+    os: str | None
+    os_version: str | None
+    device: str
+    bot: bool
+
+
+class UserAgentBatch(BaseModel):
+    user_agents: list[str] = Field(max_length=MAX_BATCH)
+
+
+class UserAgentInfo(BaseModel):
+    user_agent: str | None
+    browser: str | None
+    version: str | None
+    os: str | None
+    os_version: str | None
+    device: str
+    bot: bool
+
+
+class UserAgentResults(BaseModel):
+    results: list[UserAgentInfo]
+
+
+def _first_match(rules, value: str):
+    for name, pattern in rules:
+        match = pattern.search(value)
+        if match is not None:
+            return name, match.group(1) or None
+    return None, None
+
+
+def _device(value: str, bot: bool, os: str | None) -> str:
+    if bot:
+        return "bot"
+    if _TV.search(value):
+        return "tv"
+    # Android tablets are the Android devices that do not claim to be mobile.
+    if _TABLET.search(value) or (os == "Android" and "Mobile" not in value):
+        return "tablet"
+    if _MOBILE.search(value):
+        return "mobile"
+    return "desktop" if os is not None else "other"
+
+
+@lru_cache(maxsize=int(os.environ.get("USER_AGENT_CACHE_SIZE", "4096")))
+def _parse(value: str) -> UserAgent:
+    bot = _BOT.search(value) is not None
+    browser, version = _first_match(_BROWSERS, value)
+    system, system_version = _first_match(_SYSTEMS, value)
+    if system_version is not None:
+        system_version = system_version.replace("_", ".")
+        if system == "Windows":
+            system_version = _WINDOWS_VERSIONS.get(system_version, system_version)
+    return UserAgent(value, browser, version, system, system_version, _device(value, bot, system), bot)
+
+
+def parse(value: str | None) -> UserAgent:
+    # Truncated so a client cannot fill the cache with arbitrarily long keys.
+    return _parse((value or "")[:MAX_LENGTH])
+
+
+def is_bot(value: str | None) -> bool:
+    return parse(value).bot
+
+
+def cache_stats() -> dict:
+    info = _parse.cache_info()
+    return {"hits": info.hits, "misses": info.misses, "entries": info.currsize, "max_entries": info.maxsize}